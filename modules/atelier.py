@@ -1,41 +1,31 @@
-import os
-from pathlib import Path
 import re
 import textwrap
 import threading
 import time
 import traceback
-import tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-import openai
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules.config import MODEL, LANGUAGE, PROMPT, WIDTH
+from modules.memory import translationMemory, getMemoryString
+from modules.scheduler import createCompletion
+from modules.profiler import profiled, profiledFile
+from modules.placeholders import compileCodes, maskCodes, unmaskCodes, LOOSEFORMAT
+from modules.cleanup import compileCleanup, cleanText
+from modules.tokens import countStatic, countText, getOutputRatio
+from modules.speakers import registerNames
+from modules.dedup import isCollecting
 
 #Globals
-MODEL = os.getenv('model')
-TIMEOUT = int(os.getenv('timeout'))
-LANGUAGE=os.getenv('language').capitalize()
 INPUTAPICOST = .002 # Depends on the model https://openai.com/pricing
 OUTPUTAPICOST = .002
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
-THREADS = int(os.getenv('threads')) # Controls how many threads are working on a single file (May have to drop this)
 LOCK = threading.Lock()
-WIDTH = int(os.getenv('width'))
-LISTWIDTH = int(os.getenv('listWidth'))
 NOTEWIDTH = 40
 MAXHISTORY = 10
 ESTIMATE = ''
 totalTokens = [0, 0]
-NAMESLIST = []
+NAMESLIST = registerNames([])
+CODES = compileCodes('{}', 'N', LOOSEFORMAT)   # Control code placeholders, see modules/placeholders.py
+CLEANUP = compileCleanup(['standard', 'prompts', 'punctuation'], LANGUAGE)   # See modules/cleanup.py
 
 #tqdm Globals
 BAR_FORMAT='{l_bar}{bar:10}{r_bar}{bar:-10b}'
@@ -46,10 +36,16 @@ LEAVE=False
 FIXTEXTWRAP = True
 IGNORETLTEXT = True
 
+@profiledFile
 def handleAtelier(filename, estimate):
     global ESTIMATE, totalTokens
     ESTIMATE = estimate
 
+    # The dedup collect pass only gathers lines, nothing is written, printed or counted
+    if isCollecting():
+        openFiles(filename)
+        return ''
+
     if estimate:
         start = time.time()
         translatedData = openFiles(filename)
@@ -81,6 +77,7 @@ def handleAtelier(filename, estimate):
 
     return getResultString(['', totalTokens, None], end - start, 'TOTAL')
 
+@profiled('load')
 def openFiles(filename):
     with open('files/' + filename, 'r', encoding='UTF-8') as f:
         translatedData = parseText(f, filename)
@@ -94,7 +91,7 @@ def getResultString(translatedData, translationTime, filename):
         '[Input: ' + str(translatedData[1][0]) + ']'\
         '[Output: ' + str(translatedData[1][1]) + ']'\
         '[Cost: ${:,.4f}'.format((translatedData[1][0] * .001 * INPUTAPICOST) +\
-        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']'
+        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']' + getMemoryString()
     timeString = Fore.BLUE + '[' + str(round(translationTime, 1)) + 's]'
 
     if translatedData[2] is None:
@@ -170,126 +167,15 @@ def translateText(data, pbar):
         pbar.update()
     return [data, totalTokens]
         
+@profiled('subVars')
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '{Nested_' + str(count) + '}')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '{Ascii_' + str(count) + '}')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '{Color_' + str(count) + '}')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '{N_' + str(count) + '}')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '{Var_' + str(count) + '}')
-            count += 1
-
-    # Formatting
-    count = 0
-    if '笑えるよね.' in jaString:
-        print('t')
-    formatList = re.findall(r'[\\]+[\w]+\[.+?\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '{FCode_' + str(count) + '}')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return maskCodes(jaString, CODES)
 
+@profiled('resubVars')
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('{Nested_' + str(count) + '}', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('{Ascii_' + str(count) + '}', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('{Color_' + str(count) + '}', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('{N_' + str(count) + '}', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('{Var_' + str(count) + '}', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('{FCode_' + str(count) + '}', var)
-            count += 1
-
-    # Remove Color Variables Spaces
-    # if '\\c' in translatedText:
-    #     translatedText = re.sub(r'\s*(\\+c\[[1-9]+\])\s*', r' \1', translatedText)
-    #     translatedText = re.sub(r'\s*(\\+c\[0+\])', r'\1', translatedText)
-    return translatedText
-
-@retry(exceptions=Exception, tries=5, delay=5)
+    return unmaskCodes(translatedText, allList, CODES)
+
+@translationMemory
 def translateGPT(t, history, fullPromptFlag):
     # Sub Vars
     varResponse = subVars(t)
@@ -301,7 +187,6 @@ def translateGPT(t, history, fullPromptFlag):
     
     # If ESTIMATE is True just count this as an execution and return.
     if ESTIMATE:
-        enc = tiktoken.encoding_for_model('gpt-4')
         historyRaw = ''
         if isinstance(history, list):
             for line in history:
@@ -309,8 +194,8 @@ def translateGPT(t, history, fullPromptFlag):
         else:
             historyRaw = history
 
-        inputTotalTokens = len(enc.encode(historyRaw)) + len(enc.encode(PROMPT))
-        outputTotalTokens = len(enc.encode(t)) * 2   # Estimating 2x the size of the original text
+        inputTotalTokens = countText(historyRaw) + countStatic(PROMPT)
+        outputTotalTokens = round(countText(t) * getOutputRatio(2))   # 2x the size of the original text until calibrated
         totalTokens = [inputTotalTokens, outputTotalTokens]
         return (t, totalTokens)
 
@@ -342,13 +227,12 @@ def translateGPT(t, history, fullPromptFlag):
         msg.append({"role": "user", "content": history})
     msg.append({"role": "user", "content": user})
 
-    response = openai.ChatCompletion.create(
+    response = createCompletion(
         temperature=0,
         frequency_penalty=0.2,
         presence_penalty=0.2,
         model=MODEL,
         messages=msg,
-        request_timeout=TIMEOUT,
     )
 
     # Save Translated Text
@@ -359,23 +243,7 @@ def translateGPT(t, history, fullPromptFlag):
     translatedText = resubVars(translatedText, varResponse[1])
 
     # Remove Placeholder Text
-    translatedText = translatedText.replace(LANGUAGE +' Translation: ', '')
-    translatedText = translatedText.replace('Translation: ', '')
-    translatedText = translatedText.replace('Line to Translate = ', '')
-    translatedText = translatedText.replace('Translation = ', '')
-    translatedText = translatedText.replace('Translate = ', '')
-    translatedText = translatedText.replace(LANGUAGE +' Translation:', '')
-    translatedText = translatedText.replace('Translation:', '')
-    translatedText = translatedText.replace('Line to Translate =', '')
-    translatedText = translatedText.replace('Translation =', '')
-    translatedText = translatedText.replace('Translate =', '')
-    translatedText = translatedText.replace('っ', '')
-    translatedText = translatedText.replace('ッ', '')
-    translatedText = translatedText.replace('ぁ', '')
-    translatedText = translatedText.replace('。', '.')
-    translatedText = translatedText.replace('、', ',')
-    translatedText = translatedText.replace('？', '?')
-    translatedText = translatedText.replace('！', '!')
+    translatedText = cleanText(translatedText, CLEANUP)
 
     # Return Translation
     if len(translatedText) > 15 * len(t) or "I'm sorry, but I'm unable to assist with that translation" in translatedText:
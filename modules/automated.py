@@ -2,78 +2,37 @@ import sys, os, traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from colorama import Fore
 from tqdm import tqdm
-from dotenv import load_dotenv
 import argparse
 import time
 
-# This needs to be before the module imports as some of them currently try to read and use some of these values
-# upon import, in which case if they are unset the script will crash before we can output these messages.
-envMissing = False
-load_dotenv()
-for env in ['api','key','organization','model','language','timeout','fileThreads','threads','width','listWidth']:
-    if os.getenv(env) is None or str(os.getenv(env))[:1] == '<':
-        tqdm.write(Fore.RED + f'Environment variable {env} is not set!')
-        envMissing = True
-if envMissing:
-    tqdm.write(Fore.RED + f'Some of the required environment values may not be set correctly. You can set \
-these values using an .env file, for an example see .env.example')
-
-
-from modules.rpgmakermvmz import handleMVMZ
-from modules.rpgmakerace import handleACE
-from modules.csv import handleCSV
-from modules.eushully import handleEushully
-from modules.alice import handleAlice
-from modules.tyrano import handleTyrano
-from modules.json import handleJSON
-from modules.kansen import handleKansen
-from modules.lune import handleLune
-from modules.atelier import handleAtelier
-from modules.anim import handleAnim
-from modules.nscript import handleOnscripter
-from modules.wolf import handleWOLF
-from modules.wolf2 import handleWOLF2
-from modules.javascript import handleJavascript
-from modules.irissoft import handleIris
-from modules.regex import handleRegex
+# Reads .env once and reports missing values before anything uses them. Engine modules are imported only after
+# one is picked, see modules/engines.py
+from modules.config import FILETHREADS, reportConfig
+from modules.engines import ENGINES, loadEngine
+from modules.batch import startBatch, getBatchString
+from modules.dedup import dedupProject
+from modules.journal import closeJournal, getJournalString
+from modules.estimate import hasExtractor, getEstimateString
+reportConfig()
 
 # For GPT4 rate limit will be hit if you have more than 1 thread.
 # 1 Thread for each file. Controls how many files are worked on at once.
-THREADS = int(os.getenv('fileThreads'))
-
-# [Display name, file extension, handle function]
-MODULES = [
-    ["RPGMaker MV/MZ", "json", handleMVMZ],
-    ["RPGMaker ACE", "yaml", handleACE],
-    ["CSV (From Translator++)", "csv", handleCSV],
-    ["Eushully", "csv", handleEushully],
-    ["Alice", "txt", handleAlice],
-    ["Tyrano", "ks", handleTyrano],
-    ["JSON", "json", handleJSON],
-    ["Kansen", "ks", handleKansen],
-    ["Lune", "json", handleLune],
-    ["Atelier", "txt", handleAtelier],
-    ["Anim", "json", handleAnim],
-    ["NScript", "txt", handleOnscripter],
-    ["Wolf", "json", handleWOLF],
-    ["Wolf", "txt", handleWOLF2],
-    ["Javascript", "js", handleJavascript],
-    ["Iris", "txt", handleIris],
-    ["Regex", "txt", handleRegex],
-]
+THREADS = FILETHREADS
 
 # Info Message
-tqdm.write(Fore.LIGHTYELLOW_EX + "WARNING: Once the translation starts do not close it unless you want to lose your \
-translated data. If a file fails or gets stuck, translated lines will remain translated so you don't have \
-to worry about being charged twice. You can simply copy the file generated in /translations back over to \
-/files and start the script again. It will skip over any translated text." + Fore.RESET, end='\n\n')
+tqdm.write(Fore.LIGHTYELLOW_EX + "WARNING: Translated requests are saved to journal.jsonl as they come back. If the \
+translation is closed or crashes, start the script again with the same /files and it will pick up where it stopped \
+without being charged twice. If a file fails or gets stuck, translated lines will remain translated. You can \
+simply copy the file generated in /translations back over to /files and start the script again. It will skip \
+over any translated text." + Fore.RESET, end='\n\n')
 
 def main():
     parser = argparse.ArgumentParser(description='Translation or Cost Estimation and Game Engine Selection')
     parser.add_argument('--estimate', action='store_true', help='Provide this argument to select Cost Estimation. If not provided, Translation will be selected.')
+    parser.add_argument('--batch', action='store_true', help='Provide this argument to write the requests to /batch for the Batch API instead of translating. Run again once the results are saved there.')
     # Generate the help string
     help_string = "Select game engine by providing the corresponding number:\n"
-    for i, module in enumerate(MODULES, start=1):
+    for i, module in enumerate(ENGINES, start=1):
         help_string += f"{i} for {module[0]}\n"
 
     # Add the arguments
@@ -82,6 +41,7 @@ def main():
     args = parser.parse_args()
 
     estimate = args.estimate
+    batch = args.batch
     print("estimate: ", estimate)
 
     # if estimate not in ['1', '2']:
@@ -95,44 +55,83 @@ def main():
     #             case _:
     #                 estimate = ''
 
+    if args.engine not in range(1, len(ENGINES) + 1):
+        parser.error(f'--engine has to be a number from 1 to {len(ENGINES)}')
     version = args.engine
     version = int(version) - 1
-    print("version: ", MODULES[version][2])
-    # if version not in [str(i+1) for i in range(len(MODULES))]:
+    print("version: ", ENGINES[version][0])
+
+    # Only the picked engine is imported
+    handler = loadEngine(ENGINES[version])
+    # if version not in [str(i+1) for i in range(len(ENGINES))]:
     #     while True:
     #         tqdm.write("Select game engine:\n")
-    #         for position, module in enumerate(MODULES):
+    #         for position, module in enumerate(ENGINES):
     #             tqdm.write(f'{str(position + 1).rjust(2)}. {module[0]} (.{module[1]})')
     #         version = input()
     #         try:
     #             version = int(version) - 1
     #         except:
     #             continue
-    #         if version in range(len(MODULES)):
+    #         if version in range(len(ENGINES)):
     #             break
 
+    # Offline, requests are written to /batch instead of sent
+    if batch:
+        startBatch()
+
     totalCost = Fore.RED + 'Translation module didn\'t return the total cost. Make sure the \
 files to translate are in the /files folder and that you picked the right game engine.'
 
+    # Translate every unique line in the project once, the files are then filled from the translation memory
+    filenames = [filename for filename in os.listdir("files") if filename.endswith(ENGINES[version][1])]
+    if estimate is False and batch is False:
+        start = time.time()
+        dedupTokens = dedupProject(handler, filenames, THREADS)
+        if dedupTokens != [0, 0]:
+            getResultString = sys.modules[handler.__module__].getResultString
+            tqdm.write(getResultString(['', dedupTokens, None], time.time() - start, 'DEDUP'))
+
+    failed = False
+
+    # Engines with an extractor estimate the files in separate processes, see modules/estimate.py
+    if estimate and not batch and hasExtractor(version):
+        totalCost = getEstimateString(version, filenames)
+
     # Open File (Threads)
-    with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = [executor.submit(MODULES[version][2], filename, estimate) \
-                    for filename in os.listdir("files") if filename.endswith(MODULES[version][1])]
-                    
-        for future in as_completed(futures):
-            try:
-                totalCost = future.result()
-            except Exception as e:
-                tracebackLineNo = str(traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
-                tqdm.write(Fore.RED + str(e) + '|' + tracebackLineNo + Fore.RESET)
+    else:
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            futures = [executor.submit(handler, filename, estimate) for filename in filenames]
+                        
+            for future in as_completed(futures):
+                try:
+                    totalCost = future.result()
+                    failed = failed or totalCost == 'Fail'
+                except Exception as e:
+                    failed = True
+                    tracebackLineNo = str(traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
+                    tqdm.write(Fore.RED + str(e) + '|' + tracebackLineNo + Fore.RESET)
 
     if totalCost != 'Fail':
-        if estimate is False:
+        if estimate is False and batch is False and not failed:
             # This is to encourage people to grab what's in /translated instead
             deleteFolderFiles('files')
 
+            # Everything made it to /translated, nothing left to resume
+            if getJournalString() != '':
+                tqdm.write(getJournalString())
+            closeJournal()
+
+        # The journal keeps what the failed files were already paid for
+        elif estimate is False and batch is False:
+            tqdm.write(Fore.YELLOW + 'Some files failed, /files and the journal are kept. Start the script again to \
+pick up where it stopped.' + Fore.RESET)
+
         tqdm.write(str(totalCost))
 
+    if batch:
+        tqdm.write(getBatchString())
+
     print("Process completed you may close this window, closing automatically in 10 seconds...")
     time.sleep(10)
 
@@ -0,0 +1,105 @@
+# Libraries
+import glob, hashlib, json, os, threading
+from types import SimpleNamespace
+
+# Batch Mode (Offline)
+# Instead of calling the API, every chat completion is written to batch/requests.jsonl in the Batch API format and
+# the source text is echoed back so the parsers keep going. Once the results of that file are downloaded to
+# batch/results.jsonl, running batch mode again answers every request from the results without any live API call.
+# Requests that depend on earlier translations (e.g. dialogue with a translated speaker) are written to a new
+# requests.jsonl for another round, save its output next to the first one (results_2.jsonl, ...).
+
+#Globals
+BATCHFOLDER = 'batch'
+REQUESTSFILE = os.path.join(BATCHFOLDER, 'requests.jsonl')
+RESULTSPATTERN = os.path.join(BATCHFOLDER, 'results*.jsonl')
+BATCHMODE = False
+LOCK = threading.Lock()
+RESULTS = {}
+WRITTEN = set()
+STATS = [0, 0]  # [Answered from results, Written to requests]
+ECHOED = threading.local()  # Requests echoed back on this thread, only ever counts up
+
+def startBatch():
+    global BATCHMODE
+    BATCHMODE = True
+    os.makedirs(BATCHFOLDER, exist_ok=True)
+
+    # Load results from the previous rounds
+    RESULTS.clear()
+    for resultsFile in sorted(glob.glob(RESULTSPATTERN)):
+        with open(resultsFile, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip() == '':
+                    continue
+                result = json.loads(line)
+                response = result.get('response') or {}
+                if result.get('error') is None and response.get('status_code', 200) == 200 and 'body' in response:
+                    RESULTS[result['custom_id']] = response['body']
+
+    # Start a new round of requests
+    WRITTEN.clear()
+    open(REQUESTSFILE, 'w', encoding='utf-8').close()
+
+def requestID(kwargs):
+    # The id is a hash of the request, not file/page/index: createCompletion doesn't know where a request comes from
+    # (names, database batches and dialogue all go through it) and pages are walked by several threads, so a position
+    # could point at a different request in the next round. The same request always gets the same id.
+    # Every message is part of the id, a reply is only reused for the exact same prompt, history and text. A request
+    # whose history was echoed in this round gets a new id in the next one and is written again.
+    key = json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str)
+    return 'request-' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def toResponse(body):
+    usage = body.get('usage') or {}
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=choice['message']['content'])) \
+            for choice in body['choices']],
+        usage=SimpleNamespace(
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            total_tokens=usage.get('total_tokens', 0),
+        ),
+    )
+
+def batchCompletion(kwargs):
+    customID = requestID(kwargs)
+
+    # Answered in a previous round
+    if customID in RESULTS:
+        with LOCK:
+            STATS[0] += 1
+        return toResponse(RESULTS[customID])
+
+    # Write request and echo the text back untranslated
+    with LOCK:
+        if customID not in WRITTEN:
+            WRITTEN.add(customID)
+            STATS[1] += 1
+            with open(REQUESTSFILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'custom_id': customID,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': kwargs,
+                }, ensure_ascii=False) + '\n')
+    ECHOED.count = echoCount() + 1
+    return toResponse({'choices': [{'message': {'content': kwargs['messages'][-1]['content']}}]})
+
+def inBatchMode():
+    return BATCHMODE
+
+def echoCount():
+    # Taken before sending, a translateGPT call can be several requests and only some of them echoed
+    return getattr(ECHOED, 'count', 0)
+
+def wasEchoed(since):
+    # Whether a request on this thread was echoed back since echoCount() returned since
+    return echoCount() != since
+
+def getBatchString():
+    if STATS[1] > 0:
+        return f'Batch: {STATS[0]} requests answered from {RESULTSPATTERN}, {STATS[1]} requests written to \
+{REQUESTSFILE}. Submit them to the Batch API, save the output in {BATCHFOLDER} as results.jsonl (results_2.jsonl, \
+... for later rounds) and run batch mode again.'
+    return f'Batch: {STATS[0]} requests answered from {RESULTSPATTERN}, nothing left to submit.'
@@ -0,0 +1,96 @@
+# Libraries
+import atexit, json, os, threading, time
+from modules.config import BATCHSIZEFILE, BATCHTOKENS
+from modules.tokens import countText
+from modules.batch import inBatchMode
+
+# Adaptive Batch Size
+# Batches are filled line by line until either the batch size of the engine or the token budget (the text plus the
+# expected translation) is reached. The batch size grows by one after every full batch that comes back with the right
+# number of lines and shrinks when extractTranslation gets the wrong count. Sizes are kept per engine in
+# batchsize.json so the next run starts where the last one ended. The file is written every SAVEINTERVAL seconds
+# and when the tool exits, not after every batch.
+
+#Globals
+SAVEINTERVAL = 60
+MAXBATCHSIZE = 100
+LOCK = threading.Lock()
+SIZES = None    # Engine -> [Batch Size, Mismatch Rate]
+SAVELOCK = threading.Lock()
+SAVED = None    # Time of the last save, None until something changed
+
+def loadSizes():
+    global SIZES
+    with LOCK:
+        if SIZES is None:
+            SIZES = {}
+            if BATCHSIZEFILE != '' and os.path.exists(BATCHSIZEFILE):
+                try:
+                    with open(BATCHSIZEFILE, 'r', encoding='utf-8') as f:
+                        SIZES = json.load(f)
+                except ValueError:
+                    SIZES = {}
+    return SIZES
+
+def saveSizes():
+    global SAVED
+    if BATCHSIZEFILE == '':
+        return
+    with LOCK:
+        data = json.dumps(SIZES, indent=4)
+        SAVED = time.monotonic()
+    with SAVELOCK:
+        with open(BATCHSIZEFILE + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(BATCHSIZEFILE + '.tmp', BATCHSIZEFILE)
+
+def getBatchSize(engine, defaultSize):
+    loadSizes()
+    with LOCK:
+        return int(SIZES.setdefault(engine, [defaultSize, 0])[0])
+
+def tokenBatches(lines, engine, defaultSize):
+    batchSize = getBatchSize(engine, defaultSize)
+    batches = []
+    batch = []
+    tokens = 0
+    for line in lines:
+        # Line tag, the line and about twice as much for the translation
+        lineTokens = 10 + countText(str(line)) * 3
+        if len(batch) > 0 and (len(batch) >= batchSize or tokens + lineTokens > BATCHTOKENS):
+            batches.append(batch)
+            batch = []
+            tokens = 0
+        batch.append(line)
+        tokens += lineTokens
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+def reportBatch(engine, size, success):
+    global SAVED
+    # Batch mode keeps the sizes as they are, requests of the next round have to be split the same way to be found in
+    # the results. Echoed requests would say nothing about the model either.
+    if inBatchMode():
+        return
+
+    loadSizes()
+    with LOCK:
+        batchSize, mismatchRate = SIZES.get(engine, [size, 0])
+        mismatchRate = mismatchRate * 0.8 + (0 if success else 0.2)
+
+        # Grow only when the batch was full, shrink when the model lost track of the lines
+        if not success:
+            batchSize = max(1, int(batchSize * 0.75))
+        elif mismatchRate < 0.05 and size >= batchSize:
+            batchSize = min(MAXBATCHSIZE, batchSize + 1)
+
+        SIZES[engine] = [batchSize, round(mismatchRate, 4)]
+
+        # First change of the run, make sure it's saved on exit
+        if SAVED is None:
+            SAVED = time.monotonic()
+            atexit.register(saveSizes)
+        due = time.monotonic() - SAVED >= SAVEINTERVAL
+    if due:
+        saveSizes()
@@ -0,0 +1,423 @@
+# Libraries
+import argparse, csv, importlib, io, json, os, random, re, shutil, subprocess, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from argparse import Namespace
+from colorama import Fore
+from ruamel.yaml import YAML
+from tqdm import tqdm
+from modules import mockserver
+from modules.placeholders import compileCodes, maskCodes, unmaskCodes
+from modules.cleanup import RULES, compileCleanup, cleanText
+
+# Benchmark
+# Builds synthetic game projects, runs the engine modules against the local mock server and writes throughput
+# numbers to a JSON file so runs can be compared between commits. Nothing leaves the machine and nothing is billed.
+#
+#   python start-benchmark.py --engines mvmz,tyrano --maps 50 --output bench.json
+#   python start-benchmark.py --placeholders --output placeholders.json
+#
+# lines/requests per second are wall clock, cpuTime is the time spent parsing and formatting in this process and
+# requestTime is the time the engines spent waiting on the API (summed over threads).
+
+#Globals
+ROOT = os.getcwd()
+SYLLABLES = ['あ', 'い', 'う', 'え', 'お', 'か', 'き', 'く', 'け', 'こ', 'さ', 'し', 'す', 'た', 'ち', 'つ', 'な', 'に', \
+    'の', 'は', 'ひ', 'ま', 'み', 'よ', 'ら', 'り', 'る', 'わ', 'を', 'ん', 'カ', 'タ', 'ナ', '森', '村', '城', '剣', '魔']
+SPEAKERS = ['グレイス', 'アリス', '村長', '兵士', '商人']
+RANDOM = random.Random()
+LOCK = threading.Lock()
+REQUESTTIME = [0.0, 0]  # [Seconds waiting on the API, Calls]
+
+def japanese(minLength, maxLength):
+    text = ''.join(RANDOM.choice(SYLLABLES) for i in range(RANDOM.randint(minLength, maxLength)))
+    if RANDOM.random() < 0.2:
+        text = '\\C[2]' + text + '\\C[0]'
+    return text + RANDOM.choice(['。', '！', '？', '…'])
+
+# Generators, each writes its project to /files
+def createMVMZPage(settings):
+    codeList = []
+    for i in range(settings.lines):
+        roll = RANDOM.random()
+        if roll < 0.15:
+            codeList.append({'code': 102, 'indent': 0, 'parameters': [[japanese(2, 5), japanese(2, 5)], 1, 0, 2, 0]})
+        elif roll < 0.2:
+            codeList.append({'code': 122, 'indent': 0, 'parameters': [1, 1, 0, 4, f'"{japanese(3, 8)}"']})
+        else:
+            codeList.append({'code': 101, 'indent': 0, 'parameters': ['', 0, 0, 2, RANDOM.choice(SPEAKERS)]})
+            for j in range(RANDOM.randint(1, 3)):
+                codeList.append({'code': 401, 'indent': 0, 'parameters': [japanese(8, 30)]})
+    codeList.append({'code': 0, 'indent': 0, 'parameters': []})
+    return {'list': codeList}
+
+def generateMVMZ(settings):
+    for mapID in range(1, settings.maps + 1):
+        events = [None]
+        for eventID in range(1, settings.events + 1):
+            events.append({'id': eventID, 'name': f'EV{eventID:03}', 'note': '', \
+                'pages': [createMVMZPage(settings) for i in range(settings.pages)]})
+        with open(f'files/Map{mapID:03}.json', 'w', encoding='utf-8') as f:
+            json.dump({'displayName': japanese(2, 4), 'events': events}, f, ensure_ascii=False)
+
+    commonEvents = [None]
+    for eventID in range(1, settings.commonEvents + 1):
+        commonEvents.append({'id': eventID, 'name': f'CE{eventID:03}', \
+            'list': createMVMZPage(settings)['list'], 'switchId': 1, 'trigger': 0})
+    with open('files/CommonEvents.json', 'w', encoding='utf-8') as f:
+        json.dump(commonEvents, f, ensure_ascii=False)
+
+def generateACE(settings):
+    yaml = YAML(pure=True)
+    for mapID in range(1, settings.maps + 1):
+        events = {}
+        for eventID in range(1, settings.events + 1):
+            pages = []
+            for i in range(settings.pages):
+                codeList = [{'c': 401, 'i': 0, 'p': [japanese(8, 30)]} for j in range(settings.lines)]
+                codeList.append({'c': 0, 'i': 0, 'p': []})
+                pages.append({'list': codeList})
+            events[eventID] = {'id': eventID, 'name': f'EV{eventID:03}', 'pages': pages}
+        with open(f'files/Map{mapID:03}.yaml', 'w', encoding='utf-8') as f:
+            yaml.dump({'display_name': japanese(2, 4), 'events': events}, f)
+
+def generateTyrano(settings):
+    for fileID in range(1, settings.files + 1):
+        lines = []
+        for i in range(settings.ksLines):
+            lines.append(f'[{RANDOM.choice(SPEAKERS)}][@]')
+            lines.append(f'[ns]{japanese(8, 30)}[p]')
+        with open(f'files/scene{fileID:03}.ks', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+def generateWOLF(settings):
+    for mapID in range(1, settings.maps + 1):
+        events = []
+        for eventID in range(settings.events):
+            pages = []
+            for i in range(settings.pages):
+                codeList = [{'code': 101, 'intArgs': [], 'stringArgs': [japanese(8, 30)]} \
+                    for j in range(settings.lines)]
+                pages.append({'list': codeList})
+            events.append({'id': eventID, 'name': f'EV{eventID:03}', 'pages': pages})
+        with open(f'files/Map{mapID:03}.json', 'w', encoding='utf-8') as f:
+            json.dump({'events': events}, f, ensure_ascii=False)
+
+def generateCSV(settings):
+    for fileID in range(1, settings.files + 1):
+        with open(f'files/data{fileID:03}.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Original Text', 'Initial'])
+            for i in range(settings.csvRows):
+                writer.writerow([japanese(5, 30), ''])
+
+# [Module, Handler, Generator, Extension, Stdin (for engines that ask questions)]
+ENGINES = {
+    'mvmz': ['modules.rpgmakermvmz', 'handleMVMZ', generateMVMZ, 'json', ''],
+    'ace': ['modules.rpgmakerace', 'handleACE', generateACE, 'yaml', ''],
+    'tyrano': ['modules.tyrano', 'handleTyrano', generateTyrano, 'ks', ''],
+    'wolf': ['modules.wolf', 'handleWOLF', generateWOLF, 'json', ''],
+    'csv': ['modules.csv', 'handleCSV', generateCSV, 'csv', '1\n' * 1000],
+}
+
+def getPeakRSS():
+    # In MB, not available on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def timeRequests(createCompletion):
+    def timed(**kwargs):
+        start = time.perf_counter()
+        try:
+            return createCompletion(**kwargs)
+        finally:
+            with LOCK:
+                REQUESTTIME[0] += time.perf_counter() - start
+                REQUESTTIME[1] += 1
+    return timed
+
+def runEngine(name, settings):
+    moduleName, handlerName, generator, extension, stdin = ENGINES[name]
+
+    # Fresh project
+    for folder in ['files', 'translated']:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+    RANDOM.seed(settings.seed)
+    generator(settings)
+    filenames = sorted(filename for filename in os.listdir('files') if filename.endswith(extension))
+    projectBytes = sum(os.path.getsize(os.path.join('files', filename)) for filename in filenames)
+
+    engine = importlib.import_module(moduleName)
+    if engine.createCompletion.__name__ != 'timed':
+        engine.createCompletion = timeRequests(engine.createCompletion)
+    handler = getattr(engine, handlerName)
+
+    # Run
+    for key in mockserver.STATS:
+        mockserver.STATS[key] = 0
+    REQUESTTIME[0], REQUESTTIME[1] = 0.0, 0
+    sys.stdin = io.StringIO(stdin)
+    errors = 0
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    with ThreadPoolExecutor(max_workers=settings.fileThreads) as executor:
+        futures = [executor.submit(handler, filename, False) for filename in filenames]
+        for future in as_completed(futures):
+            try:
+                if future.result() == 'Fail':
+                    errors += 1
+            except Exception as e:
+                errors += 1
+                tqdm.write(Fore.RED + f'{name}: {e}' + Fore.RESET)
+    wallTime = time.perf_counter() - start
+    cpuTime = time.process_time() - cpuStart
+    sys.stdin = sys.__stdin__
+
+    stats = dict(mockserver.STATS)
+    lines = stats['lines']
+    return {
+        'files': len(filenames),
+        'projectBytes': projectBytes,
+        'errors': errors,
+        'lines': lines,
+        'requests': stats['requests'],
+        'wallTime': round(wallTime, 3),
+        'cpuTime': round(cpuTime, 3),
+        'requestTime': round(REQUESTTIME[0], 3),
+        'linesPerSecond': round(lines / wallTime, 2) if wallTime > 0 else 0,
+        'requestsPerSecond': round(stats['requests'] / wallTime, 2) if wallTime > 0 else 0,
+        'tokensPerLine': round((stats['promptTokens'] + stats['completionTokens']) / lines, 1) if lines > 0 else 0,
+        'promptTokens': stats['promptTokens'],
+        'completionTokens': stats['completionTokens'],
+        'mockErrors': stats['errors'] + stats['rateLimits'],
+        'mismatches': stats['mismatches'],
+        'peakRSS': getPeakRSS(),
+    }
+
+# Placeholders
+# --placeholders times modules/placeholders.py against the six scans the engines used to run for subVars/resubVars,
+# and modules/cleanup.py against the replace loop plus ー regex cleanTranslatedText used to run. The dialogue of the MV/MZ project in /files is used when there is one, generated lines with the usual codes if not.
+CODES = ['\\C[2]', '\\C[0]', '\\N[1]', '\\I[64]', '\\V[3]', '\\FS[24]', '\\N[\\V[1]]', '\\{', '\\.', '\\|', '\\!']
+
+def legacySubVars(jaString):
+    jaString = jaString.replace('\u3000', ' ')
+    allList = []
+    for name, pattern in [['Nested', r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]'], ['Ascii', r'[\\]+[iIkKwWaA]+\[[0-9]+\]'], \
+        ['Color', r'[\\]+[cC]\[[0-9]+\]'], ['Noun', r'[\\]+[nN]\[.+?\]+'], ['Var', r'[\\]+[vV]\[[0-9]+\]'], \
+        ['FCode', r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]']]:
+        codeList = set(re.findall(pattern, jaString))
+        for count, code in enumerate(codeList):
+            jaString = jaString.replace(code, f'[{name}_{count}]')
+        allList.append(codeList)
+    return [jaString, allList]
+
+def legacyResubVars(translatedText, allList):
+    for match in re.findall(r'\[\s?.+?\s?\]', translatedText):
+        translatedText = translatedText.replace(match, match.strip())
+    for name, codeList in zip(['Nested', 'Ascii', 'Color', 'Noun', 'Var', 'FCode'], allList):
+        for count, code in enumerate(codeList):
+            translatedText = translatedText.replace(f'[{name}_{count}]', code)
+    return translatedText
+
+def legacyCleanup(translatedText, replacements):
+    for target, replacement in replacements.items():
+        translatedText = translatedText.replace(target, replacement)
+    return re.sub(r'(?<=(.))ー+', lambda match: match.group(1) * (len(match.group(0)) - 1), translatedText)
+
+def timeCleanup(batches, clean, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        for batch in batches:
+            clean(batch)
+    return round(time.perf_counter() - start, 4)
+
+def findDialogue(data, lines):
+    # Text of every 401/405/102 command anywhere in an MV/MZ file
+    if isinstance(data, list):
+        for item in data:
+            findDialogue(item, lines)
+    elif isinstance(data, dict):
+        if data.get('code') in [401, 405] and len(data.get('parameters', [])) > 0 \
+            and isinstance(data['parameters'][0], str):
+            lines.append(data['parameters'][0])
+        elif data.get('code') == 102 and len(data.get('parameters', [])) > 0:
+            lines += [choice for choice in data['parameters'][0] if isinstance(choice, str)]
+        for value in data.values():
+            if isinstance(value, (list, dict)):
+                findDialogue(value, lines)
+
+def getCodeLines(settings):
+    lines = []
+    if os.path.isdir('files'):
+        for filename in sorted(os.listdir('files')):
+            if filename.endswith('.json'):
+                try:
+                    with open(os.path.join('files', filename), 'r', encoding='utf-8-sig') as f:
+                        findDialogue(json.load(f), lines)
+                except (OSError, ValueError):
+                    continue
+    if len(lines) > 0:
+        return ['files', lines]
+
+    RANDOM.seed(settings.seed)
+    for i in range(settings.csvRows * settings.files):
+        # Codes go between characters, never inside another code
+        characters = [RANDOM.choice(SYLLABLES) for j in range(RANDOM.randint(8, 30))] + ['。']
+        for j in range(RANDOM.randint(0, 4)):
+            characters.insert(RANDOM.randint(0, len(characters)), RANDOM.choice(CODES))
+        lines.append(''.join(characters))
+    return ['generated', lines]
+
+def timeRoundTrip(batches, mask, unmask, repeat):
+    # [Seconds masking, Seconds restoring, Batches that didn't come back the same]
+    maskTime = unmaskTime = 0
+    broken = 0
+    for i in range(repeat):
+        for batch in batches:
+            start = time.perf_counter()
+            masked = mask(batch)
+            middle = time.perf_counter()
+            restored = unmask(masked[0], masked[1])
+            unmaskTime += time.perf_counter() - middle
+            maskTime += middle - start
+            if i == 0 and restored != batch.replace('\u3000', ' '):
+                broken += 1
+    return [round(maskTime, 4), round(unmaskTime, 4), broken]
+
+def runPlaceholders(settings):
+    source, lines = getCodeLines(settings)
+
+    # Same payload translateGPT builds for a batch
+    batches = []
+    for i in range(0, len(lines), 40):
+        batches.append('\n'.join([f'`<Line{j}>{item}</Line{j}>`' for j, item in enumerate(lines[i:i + 40])]))
+    codes = compileCodes('[]', 'Noun')
+    legacy = timeRoundTrip(batches, legacySubVars, legacyResubVars, settings.repeat)
+    compiled = timeRoundTrip(batches, lambda text: maskCodes(text, codes), \
+        lambda text, table: unmaskCodes(text, table, codes), settings.repeat)
+
+    # The MV/MZ rules on responses that still have some of the Japanese in them
+    ruleSets = ['standard', 'tags', 'quotes', 'honorifics']
+    cleanup = compileCleanup(ruleSets, 'English', True)
+    replacements = {target.replace('{language}', 'English'): replacement for ruleSet in ruleSets \
+        for target, replacement in RULES[ruleSet].items()}
+    responses = [f'English Translation: {batch}' for batch in batches]
+    legacyCleanupTime = timeCleanup(responses, lambda text: legacyCleanup(text, replacements), settings.repeat)
+    compiledCleanupTime = timeCleanup(responses, lambda text: cleanText(text, cleanup), settings.repeat)
+    return {
+        'source': source,
+        'lines': len(lines),
+        'batches': len(batches),
+        'repeat': settings.repeat,
+        'legacy': {'subVars': legacy[0], 'resubVars': legacy[1], 'broken': legacy[2], 'cleanup': legacyCleanupTime},
+        'compiled': {'subVars': compiled[0], 'resubVars': compiled[1], 'broken': compiled[2], \
+            'cleanup': compiledCleanupTime},
+        'speedup': round((legacy[0] + legacy[1]) / max(compiled[0] + compiled[1], 1e-9), 2),
+        'cleanupSpeedup': round(legacyCleanupTime / max(compiledCleanupTime, 1e-9), 2),
+    }
+
+def getCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, \
+            text=True).stdout.strip()
+    except OSError:
+        return None
+
+def getParser():
+    parser = argparse.ArgumentParser(description='Benchmark the engine modules against the mock server')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='Comma separated: ' + ', '.join(ENGINES))
+    parser.add_argument('--maps', type=int, default=20, help='Map files (MV/MZ, ACE, Wolf)')
+    parser.add_argument('--events', type=int, default=10, help='Events per map')
+    parser.add_argument('--pages', type=int, default=2, help='Pages per event')
+    parser.add_argument('--lines', type=int, default=8, help='Commands per page')
+    parser.add_argument('--commonEvents', type=int, default=100, help='Common events in CommonEvents.json')
+    parser.add_argument('--files', type=int, default=4, help='Script files (Tyrano, CSV)')
+    parser.add_argument('--ksLines', type=int, default=2000, help='Dialogue lines per .ks file')
+    parser.add_argument('--csvRows', type=int, default=2000, help='Rows per CSV file')
+    parser.add_argument('--model', default='gpt-4o', help='Only used for pricing and batch sizes')
+    parser.add_argument('--fileThreads', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help='Median mock latency in seconds')
+    parser.add_argument('--errorRate', type=float, default=0)
+    parser.add_argument('--rateLimitRate', type=float, default=0)
+    parser.add_argument('--mismatchRate', type=float, default=0)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--placeholders', action='store_true', help='Only time subVars/resubVars, no mock server')
+    parser.add_argument('--repeat', type=int, default=20, help='Passes over the lines for --placeholders')
+    parser.add_argument('--output', default='benchmark.json')
+    return parser
+
+def main():
+    settings = getParser().parse_args()
+    engines = [name.strip() for name in settings.engines.split(',') if name.strip() != '']
+    for name in engines:
+        if name not in ENGINES:
+            sys.exit(f'Unknown engine {name}, pick from {", ".join(ENGINES)}')
+
+    if settings.placeholders:
+        results = {'placeholders': runPlaceholders(settings)}
+        tqdm.write(Fore.GREEN + f'placeholders: {json.dumps(results["placeholders"])}' + Fore.RESET)
+        writeReport(settings, results, os.path.abspath(settings.output))
+        return
+
+    # Mock server on a free port
+    server = mockserver.startServer(Namespace(host='127.0.0.1', port=0, latency=settings.latency, sigma=0.5, \
+        chunkLatency=0, errorRate=settings.errorRate, rateLimitRate=settings.rateLimitRate, retryAfter=200, \
+        mismatchRate=settings.mismatchRate, seed=settings.seed))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # The engines read .env and prompt.txt on import, so they run in a scratch folder with their own settings
+    workFolder = tempfile.mkdtemp(prefix='dazedbench')
+    for source, target in [['prompt.txt', 'prompt.txt'], ['prompt.example', 'prompt.txt'], ['vocab.txt', 'vocab.txt']]:
+        if os.path.exists(source) and not os.path.exists(os.path.join(workFolder, target)):
+            shutil.copy(source, os.path.join(workFolder, target))
+    output = os.path.abspath(settings.output)
+    os.chdir(workFolder)
+    os.environ.update({
+        'api': f'http://127.0.0.1:{server.server_address[1]}/v1',
+        'key': 'mock',
+        'organization': 'mock',
+        'model': settings.model,
+        'language': os.getenv('language') or 'English',
+        'timeout': '30',
+        'fileThreads': str(settings.fileThreads),
+        'threads': str(settings.threads),
+        'width': os.getenv('width') or '60',
+        'listWidth': os.getenv('listWidth') or '100',
+        'noteWidth': os.getenv('noteWidth') or '75',
+        'memory': '',
+        'journal': '',
+        'dedup': 'False',
+        'stream': str(settings.stream),
+        'calibration': '',  # Mock replies would end up in the calibration of real estimates
+    })
+
+    # modules/config.py was imported with the settings of .env (through the mock server), the engines read it again
+    for name in [name for name in sys.modules if name.startswith('modules.') \
+        and name not in [__name__, mockserver.__name__]]:
+        del sys.modules[name]
+
+    results = {}
+    try:
+        for name in engines:
+            tqdm.write(Fore.CYAN + f'Benchmark: {name}' + Fore.RESET)
+            results[name] = runEngine(name, settings)
+            tqdm.write(Fore.GREEN + f'{name}: {json.dumps(results[name])}' + Fore.RESET)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workFolder, ignore_errors=True)
+        server.shutdown()
+
+    writeReport(settings, results, output)
+
+def writeReport(settings, results, output):
+    report = {'commit': getCommit(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'settings': vars(settings), \
+        'results': results}
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    tqdm.write(Fore.CYAN + f'Benchmark: Results written to {output}' + Fore.RESET)
@@ -0,0 +1,92 @@
+# Libraries
+import re
+
+# Cleanup
+# What the model sends back is cleaned up before the placeholders are restored: labels like "Translation: " are
+# removed, leftover kana and full-width punctuation are swapped and ー is stretched into the character before it.
+# Engines pick the rule sets they want by name and compileCleanup() resolves them once when the engine is loaded.
+# The literal replacements run as str.replace in the order they are listed, which is faster than any single regex
+# over the text would be, and the ー pass only runs when there is a ー in the text.
+#
+#   CLEANUP = compileCleanup(['standard', 'tags'], LANGUAGE, True)
+#   translatedText = cleanText(translatedText, CLEANUP)
+
+#Globals
+ELONGATE = re.compile('ー+')
+
+# {language} is replaced with the target language
+RULES = {
+    'standard': {
+        '{language} Translation: ': '',
+        'Translation: ': '',
+        'っ': '',
+        '〜': '~',
+        'ッ': '',
+        '。': '.',
+        'Placeholder Text': '',
+    },
+    'tags': {
+        '< ': '<',
+        '</ ': '</',
+        ' >': '>',
+    },
+    'quotes': {
+        '「': '"',
+        ' 」': '"',
+    },
+    'honorifics': {
+        '- chan': '-chan',
+        '- kun': '-kun',
+        '- san': '-san',
+    },
+    'accents': {
+        'é': 'e',
+        '—': '-',
+        'ū': 'u',
+    },
+    'brackets': {
+        '[': '(',
+        ']': ')',
+    },
+    'prompts': {
+        '{language} Translation:': '',
+        'Translation:': '',
+        'Line to Translate = ': '',
+        'Line to Translate =': '',
+        'Translation = ': '',
+        'Translation =': '',
+        'Translate = ': '',
+        'Translate =': '',
+    },
+    'punctuation': {
+        'ぁ': '',
+        '、': ',',
+        '？': '?',
+        '！': '!',
+    },
+}
+
+def compileCleanup(ruleSets, language, elongate=False):
+    # Returns [[[Target, Replacement], ...], Elongate] for cleanText
+    replacements = {}
+    for ruleSet in ruleSets:
+        for target, replacement in RULES[ruleSet].items():
+            replacements[target.replace('{language}', language)] = replacement
+    return [list(replacements.items()), elongate]
+
+def stretch(match):
+    # ー+ repeats the character before it once less than its length. At the start of a line the first ー has
+    # nothing before it and stays, the rest repeat that ー.
+    start = match.start()
+    previous = match.string[start - 1] if start > 0 else ''
+    if previous in ['', '\n']:
+        return 'ー' * max(len(match.group()) - 1, 1)
+    return previous * (len(match.group()) - 1)
+
+def cleanText(text, cleanup):
+    replacements, elongate = cleanup
+    for target, replacement in replacements:
+        text = text.replace(target, replacement)
+    if elongate and 'ー' in text:
+        text = ELONGATE.sub(stretch, text)
+    return text
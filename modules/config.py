@@ -0,0 +1,101 @@
+# Libraries
+import os
+from pathlib import Path
+from colorama import Fore
+from dotenv import dotenv_values, load_dotenv
+from tqdm import tqdm
+
+# Config
+# .env, prompt.txt and vocab.txt are read once here and shared by main.py, automated.py and the engine modules.
+# Missing values, values that can't be read and names in .env that aren't settings (usually a typo) are reported by
+# reportConfig() before anything uses them. Values that can't be read fall back to the default of .env.example.
+load_dotenv()
+
+#Globals
+REQUIRED = ['api','key','organization','model','language','timeout','fileThreads','threads','width','listWidth']
+SETTINGS = REQUIRED + ['org']    # Every name that is read, see Typos below
+PROBLEMS = []   # Shown by reportConfig()
+
+for env in REQUIRED:
+    if os.getenv(env) is None or str(os.getenv(env))[:1] == '<':
+        PROBLEMS.append(f'Environment variable {env} is not set!')
+
+def getSetting(env, default):
+    # Returns the value of env with the type of default, blank uses the default
+    SETTINGS.append(env)
+    value = os.getenv(env, '').strip()
+    if value == '':
+        return default
+    if isinstance(default, bool):
+        if value.lower() not in ['true', 'false']:
+            PROBLEMS.append(f'Environment variable {env} has to be True or False, using {default}')
+            return default
+        return value.lower() == 'true'
+    if isinstance(default, int):
+        try:
+            return int(value)
+        except ValueError:
+            PROBLEMS.append(f'Environment variable {env} has to be a number, using {default}')
+            return default
+    return value
+
+def getFile(env, default):
+    # File settings can be set blank on purpose, that turns the feature off
+    SETTINGS.append(env)
+    return os.getenv(env, default).strip()
+
+def readText(path):
+    if not Path(path).exists():
+        PROBLEMS.append(f'{path} is missing!')
+        return ''
+    return Path(path).read_text(encoding='utf-8')
+
+# API
+API = os.getenv('api', '').replace(' ', '')
+KEY = os.getenv('key')
+ORGANIZATION = os.getenv('org')
+MODEL = os.getenv('model')
+TIMEOUT = getSetting('timeout', 120)
+MAXREQUESTS = getSetting('maxRequests', 8)                  # Requests in flight at the same time
+REQUESTSPERMINUTE = getSetting('requestsPerMinute', 500)    # Rate limits of your account
+TOKENSPERMINUTE = getSetting('tokensPerMinute', 200000)
+MAXRETRIES = getSetting('maxRetries', 5)                    # Retries per request for rate limits and server errors
+STREAM = getSetting('stream', False)                        # Read replies as they are generated
+
+# Translation
+LANGUAGE = str(os.getenv('language')).capitalize()
+PROMPT = readText('prompt.txt')
+VOCAB = readText('vocab.txt')
+FILETHREADS = getSetting('fileThreads', 1)     # Files worked on at once
+THREADS = getSetting('threads', 1)             # Threads per file
+WIDTH = getSetting('width', 60)
+LISTWIDTH = getSetting('listWidth', 100)
+NOTEWIDTH = getSetting('noteWidth', 75)
+VOCABFILTER = getSetting('vocabFilter', True)   # Only send the glossary entries a request uses
+DEDUP = getSetting('dedup', True)               # Translate every unique line once before the file pass
+BATCHTOKENS = getSetting('batchTokens', 4500)   # Max tokens per request for the text and its translation
+ESTIMATEPROCESSES = getSetting('estimateProcesses', 0)  # 0 uses every core
+
+# Files, leave them blank to keep things for this run only
+MEMORYFILE = getFile('memory', 'memory.db')
+MEMORYSIZE = getSetting('memorySize', 200000)   # Max number of lines kept, least recently used are dropped
+SPEAKERFILE = getFile('speakers', 'speakers.json')
+SYSTEMCACHE = getFile('systemCache', 'system.json')
+CALIBRATIONFILE = getFile('calibration', 'calibration.json')
+JOURNALFILE = getFile('journal', 'journal.jsonl')
+BATCHSIZEFILE = getFile('batchSizes', 'batchsize.json')
+PROFILEFILE = getFile('profile', '')
+PROFILEINTERVAL = getSetting('profileInterval', 0)
+
+# Typos
+for env in dotenv_values():
+    if env not in SETTINGS:
+        PROBLEMS.append(f'{env} in .env is not a setting, check the spelling against .env.example')
+
+def reportConfig():
+    # Called by main.py and automated.py, the mock server and the benchmark import this without a .env
+    for problem in PROBLEMS:
+        tqdm.write(Fore.RED + problem)
+    if len(PROBLEMS) > 0:
+        tqdm.write(Fore.RED + 'Some of the required environment values may not be set correctly. You can set \
+these values using an .env file, for an example see .env.example' + Fore.RESET)
@@ -1,40 +1,35 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai, csv
+import io, json, re, textwrap, threading, time, traceback, csv
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules.config import MODEL, LANGUAGE, PROMPT, WIDTH
+from modules.memory import translationMemory, getMemoryString
+from modules.scheduler import createCompletion
+from modules.profiler import profiled, profiledFile
+from modules.placeholders import compileCodes, maskCodes, unmaskCodes, LOOSEFORMAT
+from modules.cleanup import compileCleanup, cleanText
+from modules.batchsize import tokenBatches, reportBatch
+from modules.recovery import recoverBatch
+from modules.glossary import filterCharacters
+from modules.tokens import countRequest
+from modules.speakers import registerNames
+from modules.dedup import isCollecting
 
 #Globals
-MODEL = os.getenv('model')
-TIMEOUT = int(os.getenv('timeout'))
-LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
-THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
-WIDTH = int(os.getenv('width'))
-LISTWIDTH = int(os.getenv('listWidth'))
-NOTEWIDTH = int(os.getenv('noteWidth'))
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
+NAMESLIST = registerNames([])
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
 IGNORETLTEXT = True    # Ignores all translated text.
 MISMATCH = []   # Lists files that thdata a mismatch error (Length of GPT list response is wrong)
 BRACKETNAMES = False
+CODES = compileCodes('{}', 'Noun', LOOSEFORMAT)   # Control code placeholders, see modules/placeholders.py
+CLEANUP = compileCleanup(['standard'], LANGUAGE)   # See modules/cleanup.py
 
 # Pricing - Depends on the model https://openai.com/pricing
 # Batch Size - GPT 3.5 Struggles past 15 lines per request. GPT4 struggles past 50 lines per request
@@ -55,10 +50,16 @@ BAR_FORMAT='{l_bar}{bar:10}{r_bar}{bar:-10b}'
 POSITION = 0
 LEAVE = False
 
+@profiledFile
 def handleCSV(filename, estimate):
     global ESTIMATE, TOKENS
     ESTIMATE = estimate
 
+    # The dedup collect pass only gathers lines, nothing is written, printed or counted
+    if isCollecting():
+        openFiles(filename, io.StringIO())
+        return ''
+
     if not ESTIMATE:
         with open('translated/' + filename, 'w+t', newline='', encoding='utf-8') as writeFile:
             # Translate
@@ -93,6 +94,7 @@ def handleCSV(filename, estimate):
     else:
         return totalString
 
+@profiled('load')
 def openFiles(filename, writeFile):
     with open('files/' + filename, 'r', encoding='utf-8') as readFile, writeFile:
         translatedData = parseCSV(readFile, writeFile, filename)
@@ -112,7 +114,7 @@ def getResultString(translatedData, translationTime, filename):
         '[Input: ' + str(translatedData[1][0]) + ']'\
         '[Output: ' + str(translatedData[1][1]) + ']'\
         '[Cost: ${:,.4f}'.format((translatedData[1][0] * .001 * INPUTAPICOST) +\
-        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']'
+        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']' + getMemoryString()
     timeString = Fore.BLUE + '[' + str(round(translationTime, 1)) + 's]'
 
     if translatedData[2] is None:
@@ -326,130 +328,20 @@ def translateCSV(reader, pbar, writer, textHistory, format):
     return totalTokens
     
 
+@profiled('subVars')
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '{Nested_' + str(count) + '}')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '{Ascii_' + str(count) + '}')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '{Color_' + str(count) + '}')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '{Noun_' + str(count) + '}')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '{Var_' + str(count) + '}')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[.+?\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '{FCode_' + str(count) + '}')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return maskCodes(jaString, CODES)
 
+@profiled('resubVars')
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('{Nested_' + str(count) + '}', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('{Ascii_' + str(count) + '}', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('{Color_' + str(count) + '}', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('{Noun_' + str(count) + '}', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('{Var_' + str(count) + '}', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('{FCode_' + str(count) + '}', var)
-            count += 1
-
-    return translatedText
-
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+    return unmaskCodes(translatedText, allList, CODES)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
 ミオリ (Miori) - Female\n\
 '
     
+    characters = filterCharacters(characters, subbedT)
     system = PROMPT if fullPromptFlag else \
         f"\
 You are an expert Eroge Game translator who translates Japanese text to English.\n\
@@ -486,7 +378,7 @@ def translateText(characters, system, user, history):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = createCompletion(
         temperature=0.1,
         frequency_penalty=0.1,
         presence_penalty=0.1,
@@ -495,23 +387,13 @@ def translateText(characters, system, user, history):
     )
     return response
 
+@profiled('cleanup')
 def cleanTranslatedText(translatedText, varResponse):
-    placeholders = {
-        f'{LANGUAGE} Translation: ': '',
-        'Translation: ': '',
-        'っ': '',
-        '〜': '~',
-        'ッ': '',
-        '。': '.',
-        'Placeholder Text': ''
-        # Add more replacements as needed
-    }
-    for target, replacement in placeholders.items():
-        translatedText = translatedText.replace(target, replacement)
-
+    translatedText = cleanText(translatedText, CLEANUP)
     translatedText = resubVars(translatedText, varResponse[1])
     return [line for line in translatedText.replace('\\n', '\n').split('\n') if line]
 
+@profiled('extract')
 def extractTranslation(translatedTextList, is_list):
     pattern = r'`?<Line(\d+)>([\\]*.*?[\\]*?)<\/?Line\d+>`?'
     # If it's a batch (i.e., list), extract with tags; otherwise, return the single item.
@@ -521,39 +403,34 @@ def extractTranslation(translatedTextList, is_list):
         matchList = re.findall(pattern, translatedTextList)
         return matchList[0][1] if matchList else translatedTextList
 
+@profiled('countTokens')
 def countTokens(characters, system, user, history):
-    inputTotalTokens = 0
-    outputTotalTokens = 0
-    enc = tiktoken.encoding_for_model('gpt-4')
-    
-    # Input
-    if isinstance(history, list):
-        for line in history:
-            inputTotalTokens += len(enc.encode(line))
-    else:
-        inputTotalTokens += len(enc.encode(history))
-    inputTotalTokens += len(enc.encode(system))
-    inputTotalTokens += len(enc.encode(characters))
-    inputTotalTokens += len(enc.encode(user))
-
-    # Output
-    outputTotalTokens += round(len(enc.encode(user))*3)
-
-    return [inputTotalTokens, outputTotalTokens]
+    return countRequest(characters, system, user, history, 3)
 
 def combineList(tlist, text):
     if isinstance(text, list):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
+@translationMemory
 def translateGPT(text, history, fullPromptFlag):
     totalTokens = [0, 0]
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        tList = tokenBatches(text, __name__, BATCHSIZE)
     else:
         tList = [text]
 
+    def retranslate(batch):
+        # Used by recoverBatch to send part of a mismatched batch again
+        payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(batch)])
+        payload = payload.replace('``', '`Placeholder Text`')
+        varResponse = subVars(payload)
+        characters, system, user = createContext(fullPromptFlag, varResponse[0])
+        response = translateText(characters, system, user, history)
+        totalTokens[0] += response.usage.prompt_tokens
+        totalTokens[1] += response.usage.completion_tokens
+        return cleanTranslatedText(response.choices[0].message.content, varResponse)
+
     for index, tItem in enumerate(tList):
         # Before sending to translation, if we have a list of items, add the formatting
         if isinstance(tItem, list):
@@ -589,9 +466,12 @@ def translateGPT(text, history, fullPromptFlag):
         translatedTextList = cleanTranslatedText(translatedText, varResponse)
         if isinstance(tItem, list):
             extractedTranslations = extractTranslation(translatedTextList, True)
+            reportBatch(__name__, len(tItem), len(tItem) == len(extractedTranslations))
             tList[index] = extractedTranslations
-            if len(tItem) != len(translatedTextList):
-                mismatch = True     # Just here so breakpoint can be set
+            if len(tItem) != len(extractedTranslations):
+                # Mismatch. Keep the lines that came back and only send the rest again
+                extractedTranslations = recoverBatch(tItem, translatedTextList, retranslate, extractTranslation)
+                tList[index] = extractedTranslations
             history = extractedTranslations[-10:]  # Update history if we have a list
         else:
             # Ensure we're passing a single string to extractTranslation
@@ -0,0 +1,97 @@
+# Libraries
+import inspect, threading, traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import DEDUP, MEMORYFILE, MAXREQUESTS
+from modules.batchsize import getBatchSize
+
+# Project Deduplication
+# Before translating, every file in /files is run through the engine once while the translation memory is in
+# collect mode. Nothing is sent, instead every line that isn't in the memory yet is collected and duplicates collapse
+# onto the same memory key. Each unique line is then translated once and the real pass fills everything from memory.
+
+#Globals
+MAXROUNDS = 3
+COLLECTING = False
+LOCK = threading.Lock()
+PENDING = {}    # Group -> [translateGPT, history, fullPromptFlag, args, {key: line}]
+RESETS = []     # Called after every collect pass, see onCollected
+
+def isCollecting():
+    return COLLECTING
+
+def onCollected(reset):
+    # Caches filled while collecting hold untranslated text, the modules that keep them register a reset here
+    RESETS.append(reset)
+
+def collectLines(translateGPT, lines, keys, history, fullPromptFlag, args):
+    # Lines sharing an instruction can go in the same request. History lists are context only and get dropped
+    instruction = history if isinstance(history, str) else ''
+    group = (translateGPT.__module__, instruction, bool(fullPromptFlag), isinstance(lines, list))
+    with LOCK:
+        if group not in PENDING:
+            PENDING[group] = [translateGPT, instruction if instruction != '' else [], fullPromptFlag, args, {}]
+        for line, key in zip(lines if isinstance(lines, list) else [lines], keys):
+            PENDING[group][4][key] = line
+
+def getJobs(group):
+    translateGPT, history, fullPromptFlag, args, lineDict = PENDING[group]
+
+    # Sorted so the batches are the same every run
+    lines = [lineDict[key] for key in sorted(lineDict)]
+    if group[3] is False:
+        return [[translateGPT, line, history, fullPromptFlag, args] for line in lines]
+
+    batchSize = getBatchSize(group[0], inspect.unwrap(translateGPT).__globals__.get('BATCHSIZE', 20))
+    return [[translateGPT, lines[i:i + batchSize], history, fullPromptFlag, args] \
+        for i in range(0, len(lines), batchSize)]
+
+def dedupProject(handler, filenames, threads):
+    global COLLECTING
+    totalTokens = [0, 0]
+    # Without the translation memory there's nowhere to keep what dedup translates, the file pass would pay again
+    if not DEDUP or MEMORYFILE == '' or len(filenames) == 0:
+        return totalTokens
+
+    for collectRound in range(MAXROUNDS):
+        # Collect
+        PENDING.clear()
+        COLLECTING = True
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                futures = [executor.submit(handler, filename, False) for filename in filenames]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            COLLECTING = False
+            for reset in RESETS:
+                reset()
+        if len(PENDING) == 0:
+            break
+
+        # Single strings (speaker names, terms, ...) end up inside other lines, so those go first and
+        # everything is collected again with them translated.
+        groups = [group for group in PENDING if group[3] is False]
+        if len(groups) == 0 or collectRound == MAXROUNDS - 1:
+            groups = list(PENDING)
+        lineCount = sum(len(PENDING[group][4]) for group in groups)
+        tqdm.write(Fore.CYAN + f'Dedup: Translating {lineCount} unique lines' + Fore.RESET)
+
+        # Translate
+        jobs = [job for group in groups for job in getJobs(group)]
+        with ThreadPoolExecutor(max_workers=MAXREQUESTS) as executor:
+            futures = [executor.submit(job[0], job[1], job[2], job[3], *job[4]) for job in jobs]
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                    totalTokens[0] += response[1][0]
+                    totalTokens[1] += response[1][1]
+                except Exception as e:
+                    traceback.print_exc()
+                    tqdm.write(Fore.RED + 'Dedup: ' + str(e) + Fore.RESET)
+        if len(groups) == len(PENDING):
+            break
+
+    PENDING.clear()
+    return totalTokens
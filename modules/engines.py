@@ -0,0 +1,36 @@
+# Libraries
+import importlib
+
+# Engines
+# Every supported engine and where its handler lives. Engine modules are only imported once one is picked, so
+# starting the tool doesn't pay for (or fail on) the 16 engines that aren't used.
+
+#Globals
+# [Display name, file extension, module, handle function]
+ENGINES = [
+    ["RPGMaker MV/MZ", "json", "rpgmakermvmz", "handleMVMZ"],
+    ["RPGMaker ACE", "yaml", "rpgmakerace", "handleACE"],
+    ["CSV (From Translator++)", "csv", "csv", "handleCSV"],
+    ["Eushully", "csv", "eushully", "handleEushully"],
+    ["Alice", "txt", "alice", "handleAlice"],
+    ["Tyrano", "ks", "tyrano", "handleTyrano"],
+    ["JSON", "json", "json", "handleJSON"],
+    ["Kansen", "ks", "kansen", "handleKansen"],
+    ["Lune", "json", "lune", "handleLune"],
+    ["Atelier", "txt", "atelier", "handleAtelier"],
+    ["Anim", "json", "anim", "handleAnim"],
+    ["NScript", "txt", "nscript", "handleOnscripter"],
+    ["Wolf", "json", "wolf", "handleWOLF"],
+    ["Wolf", "txt", "wolf2", "handleWOLF2"],
+    ["Javascript", "js", "javascript", "handleJavascript"],
+    ["Iris", "txt", "irissoft", "handleIris"],
+    ["Regex", "txt", "regex", "handleRegex"],
+]
+
+def loadModule(engine):
+    # Returns the module of an entry in ENGINES, importing it the first time
+    return importlib.import_module('modules.' + engine[2])
+
+def loadEngine(engine):
+    # Returns the handle function of an entry in ENGINES
+    return getattr(loadModule(engine), engine[3])
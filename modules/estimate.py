@@ -0,0 +1,75 @@
+# Libraries
+import multiprocessing, os, time, traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import ESTIMATEPROCESSES
+from modules.engines import ENGINES, loadModule
+
+# Cost Estimate
+# Engines with an extractor (estimateFile, MV/MZ so far) are estimated from their unit lists, nothing is sent or
+# written and every request is counted instead (countRequest in tokens.py, with the output calibrated from earlier
+# runs). Walking the events is pure Python, so threads can't run files side by side. Files are spread over processes
+# instead, each one loads the engine once and takes the next file when it's done, biggest files first. Speaker names
+# come back here and are counted once for the project, so the total is the same for any number of processes.
+# Engines without an extractor run their handler with estimate set, see main.py.
+
+#Globals
+PROCESSES = ESTIMATEPROCESSES or os.cpu_count() or 1    # 0 uses every core
+
+def hasExtractor(version):
+    return hasattr(loadModule(ENGINES[version]), 'estimateFile')
+
+def estimateFile(version, filename):
+    # Runs in a worker process, returns [Filename, Tokens, Speakers, Result String]
+    start = time.time()
+    module = loadModule(ENGINES[version])
+    tokens, speakers = module.estimateFile(filename)
+    return [filename, tokens, speakers, module.getResultString(['', tokens, None], time.time() - start, filename)]
+
+def estimateProject(version, filenames):
+    # Returns the tokens of every file and of the speaker names in them
+    totalTokens = [0, 0]
+    speakers = set()
+    filenames = sorted(filenames, key=lambda filename: os.path.getsize(os.path.join('files', filename)), reverse=True)
+
+    def addResult(getResult):
+        try:
+            filename, tokens, names, resultString = getResult()
+        except Exception as e:
+            traceback.print_exc()
+            tqdm.write(Fore.RED + 'Estimate: ' + str(e) + Fore.RESET)
+            return
+        tqdm.write(resultString)
+        totalTokens[0] += tokens[0]
+        totalTokens[1] += tokens[1]
+        speakers.update(names)
+
+    # One process doesn't need a pool
+    if min(PROCESSES, len(filenames)) <= 1:
+        for filename in filenames:
+            addResult(lambda: estimateFile(version, filename))
+
+    # Spawned so the workers don't inherit the threads of this one (tqdm, the scheduler)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(PROCESSES, len(filenames)), mp_context=context) as executor:
+            futures = [executor.submit(estimateFile, version, filename) for filename in filenames]
+            for future in as_completed(futures):
+                addResult(future.result)
+
+    # Sorted so the names are batched the same way every time
+    start = time.time()
+    module = loadModule(ENGINES[version])
+    tokens = module.estimateSpeakers(sorted(speakers))
+    if tokens != [0, 0]:
+        tqdm.write(module.getResultString(['', tokens, None], time.time() - start, 'Speakers'))
+    totalTokens[0] += tokens[0]
+    totalTokens[1] += tokens[1]
+    return totalTokens
+
+def getEstimateString(version, filenames):
+    # Returns the TOTAL line of the engine
+    start = time.time()
+    totalTokens = estimateProject(version, filenames)
+    return loadModule(ENGINES[version]).getResultString(['', totalTokens, None], time.time() - start, 'TOTAL')
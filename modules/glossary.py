@@ -0,0 +1,78 @@
+# Libraries
+import re
+from functools import lru_cache
+from modules.config import VOCABFILTER
+
+# Glossary
+# vocab.txt and the Game Characters list used to be sent whole with every request. Only the entries whose Japanese
+# term shows up in the text of the request are sent now, characters also when their translated name is there (from
+# the history or a line that is already half translated). Entries are indexed by the first character of each term
+# so a request only checks the terms that could be in it, overlapping terms (悪魔 in 上級悪魔) are both found.
+# Lines that aren't entries (the intro, ``` fences, notes) are kept, a # section header only when an entry under it is.
+#
+#   vocab = filterVocab(VOCAB, subbedT)
+#   characters = filterCharacters(characters, subbedT)
+
+#Globals
+ENTRY = re.compile(r'^(.+?)\s*\((.+?)\)')
+JAPANESE = re.compile(r'[぀-ヿ㐀-䶿一-鿿！-～ｦ-ﾟ]')
+
+@lru_cache(maxsize=None)
+def parseGlossary(glossary, translations):
+    # Returns [Lines, Index]. Lines are [Kind, Line, Section] with Kind 'entry', 'section' or 'text', Index is
+    # First Character -> [[Term, Line Number], ...]. translations also indexes the name in brackets.
+    lines = []
+    index = {}
+    section = None
+    for line in glossary.splitlines(keepends=True):
+        stripped = line.strip()
+        match = ENTRY.match(stripped)
+        if stripped.startswith('#'):
+            section = len(lines)
+            lines.append(['section', line, None])
+        elif match and JAPANESE.search(match.group(1)):
+            terms = re.split(r'[,、]', match.group(1))
+            if translations:
+                terms.append(match.group(2))
+            for term in terms:
+                term = term.strip()
+                if term != '':
+                    index.setdefault(term[0], []).append([term, len(lines)])
+            lines.append(['entry', line, section])
+        elif stripped != '':
+            lines.append(['text', line, None])
+    return [lines, index]
+
+def findEntries(glossary, text, translations):
+    # Returns the line numbers of the entries used in text
+    lines, index = parseGlossary(glossary, translations)
+    found = set()
+    for character in index.keys() & set(text):
+        for term, number in index[character]:
+            if number not in found and term in text:
+                found.add(number)
+    return found
+
+def buildGlossary(glossary, found, translations):
+    lines, index = parseGlossary(glossary, translations)
+    sections = {lines[number][2] for number in found}
+    kept = []
+    for number, [kind, line, section] in enumerate(lines):
+        if kind == 'text' or number in found or number in sections:
+            kept.append(line if line.endswith('\n') else line + '\n')
+    return ''.join(kept)
+
+def filterVocab(vocab, text):
+    # Nothing is sent when none of the terms are used
+    if not VOCABFILTER:
+        return vocab
+    found = findEntries(vocab, text, False)
+    if len(found) == 0:
+        return ''
+    return buildGlossary(vocab, found, False)
+
+def filterCharacters(characters, text):
+    # The Game Characters line is always kept so the message is never empty
+    if not VOCABFILTER:
+        return characters
+    return buildGlossary(characters, findEntries(characters, text, True), True)
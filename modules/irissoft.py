@@ -1,38 +1,34 @@
 # Libraries
-import os, re, textwrap, threading, time, traceback, tiktoken, openai
-from pathlib import Path
+import re, textwrap, threading, time, traceback
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules.config import MODEL, LANGUAGE, PROMPT, VOCAB, WIDTH
+from modules.memory import translationMemory, getMemoryString
+from modules.scheduler import createCompletion
+from modules.profiler import profiled, profiledFile
+from modules.placeholders import compileCodes, maskCodes, unmaskCodes
+from modules.cleanup import compileCleanup, cleanText
+from modules.batchsize import tokenBatches, reportBatch
+from modules.recovery import recoverBatch
+from modules.glossary import filterCharacters, filterVocab
+from modules.tokens import countRequest
+from modules.speakers import registerNames
+from modules.dedup import isCollecting
 
 #Globals
-MODEL = os.getenv('model')
-TIMEOUT = int(os.getenv('timeout'))
-LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
-THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
-WIDTH = int(os.getenv('width'))
-LISTWIDTH = int(os.getenv('listWidth'))
 NOTEWIDTH = 70
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
+NAMESLIST = registerNames([])
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
 IGNORETLTEXT = False    # Ignores all translated text.
 MISMATCH = []   # Lists files that throw a mismatch error (Length of GPT list response is wrong)
+CODES = compileCodes('[]', 'Noun')   # Control code placeholders, see modules/placeholders.py
+CLEANUP = compileCleanup(['standard'], LANGUAGE, True)   # See modules/cleanup.py
 
 #tqdm Globals
 BAR_FORMAT='{l_bar}{bar:10}{r_bar}{bar:-10b}'
@@ -51,10 +47,16 @@ elif 'gpt-4' in MODEL:
     OUTPUTAPICOST = .015
     BATCHSIZE = 40
 
+@profiledFile
 def handleIris(filename, estimate):
     global ESTIMATE
     ESTIMATE = estimate
 
+    # The dedup collect pass only gathers lines, nothing is written, printed or counted
+    if isCollecting():
+        openFiles(filename)
+        return ''
+
     if ESTIMATE:
         start = time.time()
         translatedData = openFiles(filename)
@@ -101,7 +103,7 @@ def getResultString(translatedData, translationTime, filename):
         '[Input: ' + str(translatedData[1][0]) + ']'\
         '[Output: ' + str(translatedData[1][1]) + ']'\
         '[Cost: ${:,.4f}'.format((translatedData[1][0] * .001 * INPUTAPICOST) +\
-        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']'
+        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']' + getMemoryString()
     timeString = Fore.BLUE + '[' + str(round(translationTime, 1)) + 's]'
 
     if translatedData[2] == None:
@@ -118,6 +120,7 @@ def getResultString(translatedData, translationTime, filename):
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
 
+@profiled('load')
 def openFiles(filename):
     with open('files/' + filename, 'r', encoding='shift_jis') as readFile:
         translatedData = parseIris(readFile, filename)
@@ -392,124 +395,13 @@ def getSpeaker(speaker, pbar, filename):
                                
     return [speaker,[0,0]]
 
+@profiled('subVars')
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return maskCodes(jaString, CODES)
 
+@profiled('resubVars')
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
-
-    return translatedText
-
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+    return unmaskCodes(translatedText, allList, CODES)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -524,7 +416,9 @@ def createContext(fullPromptFlag, subbedT):
 ノーラ (Nora) - Female\n\
 '
     
-    system = PROMPT + VOCAB if fullPromptFlag else \
+    characters = filterCharacters(characters, subbedT)
+    vocab = filterVocab(VOCAB, subbedT)
+    system = PROMPT + vocab if fullPromptFlag else \
         f"\
 You are an expert Eroge Game translator who translates Japanese text to {LANGUAGE}.\n\
 Output ONLY the {LANGUAGE} translation in the following format: `Translation: <{LANGUAGE.upper()}_TRANSLATION>`\n\
@@ -535,7 +429,7 @@ Output ONLY the {LANGUAGE} translation in the following format: `Translation: <{
 - Maintain any spacing in the translation.\n\
 - Maintain any code text in brackets if given. (e.g `[Color_0]`, `[Ascii_0]`, `[FCode_1`], etc)\n\
 - `...` can be a part of the dialogue. Translate it as it is.\n\
-{VOCAB}\n\
+{vocab}\n\
 "
     user = f'{subbedT}'
     return characters, system, user
@@ -555,7 +449,7 @@ def translateText(characters, system, user, history):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = createCompletion(
         temperature=0.1,
         frequency_penalty=0.1,
         model=MODEL,
@@ -563,39 +457,13 @@ def translateText(characters, system, user, history):
     )
     return response
 
+@profiled('cleanup')
 def cleanTranslatedText(translatedText, varResponse):
-    placeholders = {
-        f'{LANGUAGE} Translation: ': '',
-        'Translation: ': '',
-        'っ': '',
-        '〜': '~',
-        'ッ': '',
-        '。': '.',
-        'Placeholder Text': ''
-        # Add more replacements as needed
-    }
-    for target, replacement in placeholders.items():
-        translatedText = translatedText.replace(target, replacement)
-
-    # Elongate Long Dashes (Since GPT Ignores them...)
-    translatedText = elongateCharacters(translatedText)
+    translatedText = cleanText(translatedText, CLEANUP)
     translatedText = resubVars(translatedText, varResponse[1])
     return translatedText
 
-def elongateCharacters(text):
-    # Define a pattern to match one character followed by one or more `ー` characters
-    # Using a positive lookbehind assertion to capture the preceding character
-    pattern = r'(?<=(.))ー+'
-    
-    # Define a replacement function that elongates the captured character
-    def repl(match):
-        char = match.group(1)  # The character before the ー sequence
-        count = len(match.group(0)) - 1  # Number of ー characters
-        return char * count  # Replace ー sequence with the character repeated
-
-    # Use re.sub() to replace the pattern in the text
-    return re.sub(pattern, repl, text)
-
+@profiled('extract')
 def extractTranslation(translatedTextList, is_list):
     pattern = r'`?<Line\d+>([\\]*.*?[\\]*?)<\/?Line\d+>`?'
     # If it's a batch (i.e., list), extract with tags; otherwise, return the single item.
@@ -606,40 +474,35 @@ def extractTranslation(translatedTextList, is_list):
         matchList = re.findall(pattern, translatedTextList)
         return matchList[0][0] if matchList else translatedTextList
 
+@profiled('countTokens')
 def countTokens(characters, system, user, history):
-    inputTotalTokens = 0
-    outputTotalTokens = 0
-    enc = tiktoken.encoding_for_model('gpt-4')
-    
-    # Input
-    if isinstance(history, list):
-        for line in history:
-            inputTotalTokens += len(enc.encode(line))
-    else:
-        inputTotalTokens += len(enc.encode(history))
-    inputTotalTokens += len(enc.encode(system))
-    inputTotalTokens += len(enc.encode(characters))
-    inputTotalTokens += len(enc.encode(user))
-
-    # Output
-    outputTotalTokens += round(len(enc.encode(user))*2)
-
-    return [inputTotalTokens, outputTotalTokens]
+    return countRequest(characters, system, user, history, 2)
 
 def combineList(tlist, text):
     if isinstance(text, list):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
+@translationMemory
 def translateGPT(text, history, fullPromptFlag, pbar, filename):
     mismatch = False
     totalTokens = [0, 0]
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        tList = tokenBatches(text, __name__, BATCHSIZE)
     else:
         tList = [text]
 
+    def retranslate(batch):
+        # Used by recoverBatch to send part of a mismatched batch again
+        payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(batch)])
+        payload = re.sub(r'(<Line\d+)(><)(\/Line\d+>)', r'\1>Placeholder Text<\3', payload)
+        varResponse = subVars(payload)
+        characters, system, user = createContext(fullPromptFlag, varResponse[0])
+        response = translateText(characters, system, user, history)
+        totalTokens[0] += response.usage.prompt_tokens
+        totalTokens[1] += response.usage.completion_tokens
+        return cleanTranslatedText(response.choices[0].message.content, varResponse)
+
     for index, tItem in enumerate(tList):
         # Before sending to translation, if we have a list of items, add the formatting
         if isinstance(tItem, list):
@@ -675,21 +538,11 @@ def translateGPT(text, history, fullPromptFlag, pbar, filename):
         translatedText = cleanTranslatedText(translatedText, varResponse)
         if isinstance(tItem, list):
             extractedTranslations = extractTranslation(translatedText, True)
+            reportBatch(__name__, len(tItem), len(tItem) == len(extractedTranslations))
             if len(tItem) != len(extractedTranslations):
-                # Mismatch. Try Again
-                response = translateText(characters, system, user, history)
-                translatedText = response.choices[0].message.content
-                totalTokens[0] += response.usage.prompt_tokens
-                totalTokens[1] += response.usage.completion_tokens
-
-                # Formatting
-                translatedText = cleanTranslatedText(translatedText, varResponse)
-                if isinstance(tItem, list):
-                    extractedTranslations = extractTranslation(translatedText, True)
-                    if len(tItem) == len(extractedTranslations):
-                        tList[index] = extractedTranslations
-                    else:
-                        MISMATCH.append(filename)
+                # Mismatch. Keep the lines that came back and only send the rest again
+                extractedTranslations = recoverBatch(tItem, translatedText, retranslate, extractTranslation)
+                tList[index] = extractedTranslations
             else:
                 tList[index] = extractedTranslations
 
@@ -0,0 +1,87 @@
+# Libraries
+import json, os, threading
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import JOURNALFILE
+from modules.batch import requestID, toResponse
+
+# Translation Journal
+# Files are only written to /translated once they are done, so closing the tool or a crash used to throw away every
+# request already paid for in the files that were still open. Each completion that comes back is now appended to the
+# journal and synced to disk first, one record per request, so a translateGPT call that splits its text into several
+# batches keeps every batch that finished. On the next run createCompletion answers every request that was already
+# answered from the journal and the translation picks up where it stopped. The journal is removed once a run finishes.
+
+#Globals
+LOCK = threading.Lock()
+JOURNAL = None  # Open journal file
+REPLAY = {}     # Request ID -> [Reply, Tokens] left by the last run
+STATS = [0, 0, 0]   # [Requests Replayed, Input Tokens, Output Tokens]
+
+def openJournal():
+    global JOURNAL
+    if JOURNALFILE == '':
+        return None
+
+    with LOCK:
+        if JOURNAL is None:
+            # Replay what a previous run left behind. The last line may be cut off if it crashed while writing
+            if os.path.exists(JOURNALFILE):
+                with open(JOURNALFILE, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            REPLAY[record['request']] = [record['content'], record['tokens']]
+                        except (ValueError, KeyError):
+                            continue
+                if len(REPLAY) > 0:
+                    tqdm.write(Fore.CYAN + f'Journal: Resuming, {len(REPLAY)} requests from the last run will be \
+reused' + Fore.RESET)
+            JOURNAL = open(JOURNALFILE, 'a', encoding='utf-8')
+    return JOURNAL
+
+def replayRequest(kwargs):
+    # Returns the response the last run got for this request, None if it wasn't answered
+    if openJournal() is None:
+        return None
+    with LOCK:
+        record = REPLAY.get(requestID(kwargs))
+        if record is None:
+            return None
+        STATS[0] += 1
+        STATS[1] += record[1][0]
+        STATS[2] += record[1][1]
+
+    # Paid for last run, costs nothing now
+    return toResponse({'choices': [{'message': {'content': record[0]}}]})
+
+def recordRequest(kwargs, response):
+    journal = openJournal()
+    if journal is None:
+        return
+
+    tokens = [response.usage.prompt_tokens, response.usage.completion_tokens] if response.usage is not None \
+        else [0, 0]
+    record = json.dumps({'request': requestID(kwargs), 'content': response.choices[0].message.content, \
+        'tokens': tokens}, ensure_ascii=False)
+    with LOCK:
+        journal.write(record + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+def closeJournal():
+    # Run finished, nothing left to resume
+    global JOURNAL
+    with LOCK:
+        if JOURNAL is not None:
+            JOURNAL.close()
+            JOURNAL = None
+        REPLAY.clear()
+        if JOURNALFILE != '' and os.path.exists(JOURNALFILE):
+            os.remove(JOURNALFILE)
+
+def getJournalString():
+    if STATS[0] == 0:
+        return ''
+    return Fore.CYAN + f'Journal: Reused {STATS[0]} requests from the last run \
+[Input: {STATS[1]}][Output: {STATS[2]}]' + Fore.RESET
@@ -0,0 +1,163 @@
+# Libraries
+import hashlib, re, sqlite3, threading, time, unicodedata
+from functools import wraps
+from pathlib import Path
+from colorama import Fore
+from modules.config import MODEL, MEMORYFILE, MEMORYSIZE
+from modules.batch import echoCount, wasEchoed
+from modules.dedup import isCollecting, collectLines
+
+# Translation Memory
+# Every engine module has its own copy of translateGPT. Decorating it with @translationMemory makes it look up
+# each line in an on-disk SQLite database first and only send the lines that were never translated before.
+# Lines are keyed by their normalized text, the model, the prompt/vocab and the instruction given to the model.
+
+#Globals
+LOCK = threading.Lock()
+STATS = [0, 0]  # [Hits, Misses]
+CONNECTION = None
+
+def readPromptHash():
+    # Changing prompt.txt or vocab.txt invalidates the memory
+    sha = hashlib.sha1()
+    for path in ['prompt.txt', 'vocab.txt']:
+        if Path(path).exists():
+            sha.update(Path(path).read_bytes())
+    return sha.hexdigest()
+
+PROMPTHASH = readPromptHash()
+
+def openMemory():
+    global CONNECTION
+    if MEMORYFILE == '':
+        return None
+
+    with LOCK:
+        if CONNECTION is None:
+            CONNECTION = sqlite3.connect(MEMORYFILE, check_same_thread=False, timeout=30)
+            CONNECTION.execute('PRAGMA journal_mode=WAL')
+            CONNECTION.execute('PRAGMA synchronous=NORMAL')
+            CONNECTION.execute('CREATE TABLE IF NOT EXISTS memory (key TEXT PRIMARY KEY, source TEXT, \
+translation TEXT, used REAL)')
+            CONNECTION.execute('CREATE INDEX IF NOT EXISTS memory_used ON memory (used)')
+            CONNECTION.commit()
+    return CONNECTION
+
+def normalizeText(text):
+    # Control codes are kept verbatim so the key carries their placeholder signature
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def memoryKey(text, history, fullPromptFlag):
+    # History lists are previous lines for context, a string is an instruction and changes the translation
+    instruction = history if isinstance(history, str) else ''
+    key = '\x1f'.join([str(MODEL), PROMPTHASH, instruction, str(bool(fullPromptFlag)), normalizeText(text)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def isTranslatable(text):
+    return isinstance(text, str) and re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', text) is not None
+
+def getMemory(keys):
+    connection = openMemory()
+    if connection is None or len(keys) == 0:
+        return {}
+
+    found = {}
+    with LOCK:
+        uniqueKeys = list(set(keys))
+        for i in range(0, len(uniqueKeys), 500):
+            chunk = uniqueKeys[i:i + 500]
+            rows = connection.execute(f'SELECT key, translation FROM memory WHERE key IN \
+({",".join("?" * len(chunk))})', chunk).fetchall()
+            found.update(rows)
+
+        # Refresh LRU timestamp
+        if len(found) > 0:
+            now = time.time()
+            connection.executemany('UPDATE memory SET used = ? WHERE key = ?', [(now, key) for key in found])
+            connection.commit()
+    return found
+
+def setMemory(entries):
+    connection = openMemory()
+    if connection is None or len(entries) == 0:
+        return
+
+    with LOCK:
+        now = time.time()
+        connection.executemany('INSERT OR REPLACE INTO memory (key, source, translation, used) VALUES (?, ?, ?, ?)', \
+            [(key, source, translation, now) for key, source, translation in entries])
+
+        # Evict least recently used lines
+        count = connection.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+        if count > MEMORYSIZE:
+            connection.execute('DELETE FROM memory WHERE key IN (SELECT key FROM memory ORDER BY used ASC LIMIT ?)', \
+                (count - MEMORYSIZE,))
+        connection.commit()
+
+def getMemoryString():
+    if MEMORYFILE == '':
+        return ''
+    return Fore.CYAN + '[Memory: ' + str(STATS[0]) + ' hits / ' + str(STATS[1]) + ' misses]'
+
+def translationMemory(translateGPT):
+    # Every request that is sent is journaled by createCompletion
+    send = translateGPT
+
+    @wraps(translateGPT)
+    def wrapper(text, history, fullPromptFlag, *args):
+        if openMemory() is None:
+            # Nothing to collect into, the text is left for the file pass
+            if isCollecting():
+                return [text, [0, 0]]
+            return send(text, history, fullPromptFlag, *args)
+        estimate = translateGPT.__globals__.get('ESTIMATE')
+
+        # Lookup
+        lines = text if isinstance(text, list) else [text]
+        keys = [memoryKey(line, history, fullPromptFlag) if isTranslatable(line) else None for line in lines]
+        found = getMemory([key for key in keys if key is not None])
+        missing = [i for i, key in enumerate(keys) if key is not None and key not in found]
+        if not isCollecting():
+            with LOCK:
+                STATS[0] += len([key for key in keys if key in found])
+                STATS[1] += len(missing)
+
+        # Everything was already translated
+        if len(missing) == 0 and len(found) > 0:
+            finalList = [found[key] if key in found else lines[i] for i, key in enumerate(keys)]
+            return [finalList if isinstance(text, list) else finalList[0], [0, 0]]
+
+        # Project dedup pass, collect what's missing and give the text back untranslated
+        if isCollecting():
+            if len(missing) > 0:
+                collectLines(wrapper, [lines[i] for i in missing] if isinstance(text, list) else text, \
+                    [keys[i] for i in missing], history, fullPromptFlag, args)
+            finalList = [found[key] if key in found else lines[i] for i, key in enumerate(keys)]
+            return [finalList if isinstance(text, list) else finalList[0], [0, 0]]
+
+        # Nothing was found, translate as usual. Lines echoed back in batch mode are the source text, not translations.
+        since = echoCount()
+        if len(found) == 0:
+            response = send(text, history, fullPromptFlag, *args)
+            translatedList = response[0] if isinstance(text, list) else [response[0]]
+            if not estimate and not wasEchoed(since) and len(translatedList) == len(lines):
+                setMemory([(keys[i], lines[i], translatedList[i]) for i in missing \
+                    if isinstance(translatedList[i], str) and translatedList[i] != lines[i]])
+            return response
+
+        # Only send the lines we don't have
+        response = send([lines[i] for i in missing], history, fullPromptFlag, *args)
+        translatedList = response[0]
+        if len(translatedList) != len(missing):
+            # Mismatch, keep the list length wrong so the caller sees it
+            return [translatedList[:len(missing)], response[1]]
+
+        finalList = [found[key] if key in found else lines[i] for i, key in enumerate(keys)]
+        for i, translatedText in zip(missing, translatedList):
+            finalList[i] = translatedText
+        if not estimate and not wasEchoed(since):
+            setMemory([(keys[i], lines[i], translatedText) for i, translatedText in zip(missing, translatedList) \
+                if isinstance(translatedText, str) and translatedText != lines[i]])
+        return [finalList, response[1]]
+    return wrapper
@@ -0,0 +1,177 @@
+# Libraries
+import argparse, hashlib, json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from colorama import Fore
+from tqdm import tqdm
+from modules.tokens import countText
+
+# Mock Server
+# A local stand in for the OpenAI chat completions endpoint so the tool can be tested and benchmarked with no
+# network and no cost. Point api in .env at it (e.g. http://127.0.0.1:8000/v1). Every Japanese run in the request
+# is replaced by made up words picked from its hash, so the same text always gets the same "translation" and codes,
+# placeholders and <LineN> tags are left alone. Latency, errors, rate limits and mismatched replies can be injected.
+
+#Globals
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod', \
+    'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam']
+JAPANESEPATTERN = r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９、。！？…「」『』（）]+'
+TAGPATTERN = r'<Line(\d+)>(.*?)</?Line\d+>'
+LOCK = threading.Lock()
+SETTINGS = None
+RANDOM = random.Random()
+STATS = {'requests': 0, 'lines': 0, 'errors': 0, 'rateLimits': 0, 'mismatches': 0, 'promptTokens': 0, \
+    'completionTokens': 0}
+
+def pseudoTranslate(text):
+    # Roughly one word per two characters, same text gives the same words
+    def repl(match):
+        digest = hashlib.sha1(match.group(0).encode('utf-8')).digest()
+        count = max(1, len(match.group(0)) // 2)
+        return ' '.join(WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(count)).capitalize()
+    return re.sub(JAPANESEPATTERN, repl, text)
+
+def createReply(content, mismatch):
+    lines = re.findall(TAGPATTERN, content)
+    if len(lines) == 0:
+        return f'Translation: {pseudoTranslate(content)}'
+
+    replyLines = [[index, pseudoTranslate(line)] for index, line in lines]
+    if mismatch and len(replyLines) > 1:
+        # Merge two lines like a real model does, the rest gets renumbered half of the time
+        position = RANDOM.randrange(len(replyLines) - 1)
+        replyLines[position][1] += ' ' + replyLines[position + 1][1]
+        del replyLines[position + 1]
+        if RANDOM.random() < 0.5:
+            replyLines = [[str(i), line] for i, (index, line) in enumerate(replyLines)]
+    return '\n'.join(f'`<Line{index}>{line}</Line{index}>`' for index, line in replyLines)
+
+def roll(name):
+    with LOCK:
+        return RANDOM.random() < getattr(SETTINGS, name)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        return
+
+    def sendJSON(self, status, body, headers={}):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def sendError(self, status, message, errorType, headers={}):
+        self.sendJSON(status, {'error': {'message': message, 'type': errorType, 'code': None, 'param': None}}, \
+            headers)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.sendError(404, f'Unknown path {self.path}', 'invalid_request_error')
+        with LOCK:
+            STATS['requests'] += 1
+
+        # Latency, log-normal around the median
+        time.sleep(SETTINGS.latency * RANDOM.lognormvariate(0, SETTINGS.sigma) if SETTINGS.latency > 0 else 0)
+
+        # Injected failures
+        if roll('rateLimitRate'):
+            with LOCK:
+                STATS['rateLimits'] += 1
+            return self.sendError(429, 'Rate limit reached (mock)', 'requests', \
+                {'retry-after-ms': str(SETTINGS.retryAfter)})
+        if roll('errorRate'):
+            with LOCK:
+                STATS['errors'] += 1
+            return self.sendError(500, 'The server had an error (mock)', 'server_error')
+
+        # Reply
+        messages = body.get('messages', [])
+        content = str(messages[-1]['content']) if len(messages) > 0 else ''
+        mismatch = roll('mismatchRate')
+        reply = createReply(content, mismatch)
+        promptTokens = sum(countText(str(message.get('content', ''))) for message in messages)
+        completionTokens = countText(reply)
+        with LOCK:
+            STATS['lines'] += max(1, len(re.findall(TAGPATTERN, content)))
+            STATS['mismatches'] += 1 if mismatch else 0
+            STATS['promptTokens'] += promptTokens
+            STATS['completionTokens'] += completionTokens
+
+        completionID = 'chatcmpl-mock' + hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        model = body.get('model', 'mock')
+        if body.get('stream'):
+            return self.sendStream(completionID, model, reply)
+        self.sendJSON(200, {
+            'id': completionID,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': promptTokens, 'completion_tokens': completionTokens, \
+                'total_tokens': promptTokens + completionTokens},
+        })
+
+    def sendStream(self, completionID, model, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        chunks = [reply[i:i + 8] for i in range(0, len(reply), 8)] + [None]
+        try:
+            for chunk in chunks:
+                delta = {'content': chunk} if chunk is not None else {}
+                event = {'id': completionID, 'object': 'chat.completion.chunk', 'created': int(time.time()), \
+                    'model': model, 'choices': [{'index': 0, 'delta': delta, \
+                    'finish_reason': None if chunk is not None else 'stop'}]}
+                self.wfile.write(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(SETTINGS.chunkLatency)
+            self.wfile.write(b'data: [DONE]\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            return
+
+def getStatsString():
+    return Fore.CYAN + f'[Requests: {STATS["requests"]}][Lines: {STATS["lines"]}][Errors: {STATS["errors"]}]\
+[429: {STATS["rateLimits"]}][Mismatches: {STATS["mismatches"]}][Input: {STATS["promptTokens"]}]\
+[Output: {STATS["completionTokens"]}]' + Fore.RESET
+
+def startServer(settings):
+    # Returns the server, call serve_forever() on it or run it in a thread
+    global SETTINGS
+    SETTINGS = settings
+    if settings.seed is not None:
+        RANDOM.seed(settings.seed)
+    return ThreadingHTTPServer((settings.host, settings.port), MockHandler)
+
+def getParser():
+    parser = argparse.ArgumentParser(description='Mock OpenAI compatible server for offline testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.5, help='Median seconds per request')
+    parser.add_argument('--sigma', type=float, default=0.5, help='Spread of the log-normal latency')
+    parser.add_argument('--chunkLatency', type=float, default=0.01, help='Seconds between streamed chunks')
+    parser.add_argument('--errorRate', type=float, default=0, help='Share of requests answered with a 500')
+    parser.add_argument('--rateLimitRate', type=float, default=0, help='Share of requests answered with a 429')
+    parser.add_argument('--retryAfter', type=int, default=1000, help='retry-after-ms sent with a 429')
+    parser.add_argument('--mismatchRate', type=float, default=0, help='Share of replies with two lines merged')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+def main():
+    settings = getParser().parse_args()
+    server = startServer(settings)
+    tqdm.write(Fore.GREEN + f'Mock server on http://{settings.host}:{settings.port}/v1, set api in .env to it' \
+        + Fore.RESET)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        tqdm.write(getStatsString())
+        server.server_close()
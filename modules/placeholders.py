@@ -0,0 +1,74 @@
+# Libraries
+import re
+
+# Placeholders
+# Control codes (\C[2], \N[1], \I[64], \V[3], \FS[24], ...) are swapped for placeholders like [Color_0] before text is
+# sent so the model keeps them, and swapped back once the translation comes back. All kinds of codes are found in
+# one scan of a precompiled pattern and put back in one substitution. The same code always gets the same placeholder,
+# numbered in the order the codes first show up.
+#
+#   CODES = compileCodes('[]', 'Noun')
+#   masked, table = maskCodes(text, CODES)
+#   text = unmaskCodes(translatedText, table, CODES)
+
+#Globals
+# Checked in this order at each position, a nested code wins over the codes inside it
+KINDS = ['Nested', 'Ascii', 'Color', 'Noun', 'Var', 'FCode']
+PATTERNS = [
+    r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]',  # Nested
+    r'[\\]+[iIkKwWaA]+\[[0-9]+\]',          # Icons
+    r'[\\]+[cC]\[[0-9]+\]',                 # Colors
+    r'[\\]+[nN]\[.+?\]+',                   # Names
+    r'[\\]+[vV]\[[0-9]+\]',                 # Variables
+]
+FORMAT = r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]'     # Formatting with plain arguments
+LOOSEFORMAT = r'[\\]+[\w]+\[.+?\]'                     # Formatting with anything as argument
+
+def compileCodes(brackets='[]', noun='Noun', formatPattern=FORMAT):
+    # Returns [Code Pattern, Placeholder Pattern, Brackets, Placeholder Names] for maskCodes/unmaskCodes
+    names = KINDS[:3] + [noun] + KINDS[4:]
+    # Every code starts with a backslash, the lookahead lets the scan skip everything else quickly
+    codePattern = re.compile(r'(?=\\)(?:' + '|'.join(f'({pattern})' for pattern in PATTERNS + [formatPattern]) + ')')
+
+    # Spaces the model puts inside the brackets are dropped as well
+    placeholderPattern = re.compile(re.escape(brackets[0]) + r'\s?(' + '|'.join(names) + r')_([0-9]+)\s?' + \
+        re.escape(brackets[1]))
+    return [codePattern, placeholderPattern, brackets, names]
+
+def maskCodes(text, codes):
+    # Returns [Masked Text, Table], Table has the codes of each kind in placeholder order
+    codePattern, placeholderPattern, brackets, names = codes
+    text = text.replace('\u3000', ' ')
+    table = [[] for name in names]
+    found = {}
+    parts = []
+    end = 0
+    for match in codePattern.finditer(text):
+        kind = match.lastindex - 1
+        code = match.group()
+        placeholder = found.get(code)
+        if placeholder is None:
+            placeholder = found[code] = f'{brackets[0]}{names[kind]}_{len(table[kind])}{brackets[1]}'
+            table[kind].append(code)
+        parts.append(text[end:match.start()])
+        parts.append(placeholder)
+        end = match.end()
+    if end == 0:
+        return [text, table]
+    parts.append(text[end:])
+    return [''.join(parts), table]
+
+def unmaskCodes(text, table, codes):
+    # Placeholders that aren't in the table (made up by the model) are left as they are
+    codePattern, placeholderPattern, brackets, names = codes
+    if not any(table):
+        return text
+
+    # split() gives [Text, Name, Index, Text, Name, Index, ..., Text]
+    parts = placeholderPattern.split(text)
+    for i in range(1, len(parts), 3):
+        kind = table[names.index(parts[i])]
+        index = int(parts[i + 1])
+        parts[i] = kind[index] if index < len(kind) else f'{brackets[0]}{parts[i]}_{parts[i + 1]}{brackets[1]}'
+        parts[i + 1] = ''
+    return ''.join(parts)
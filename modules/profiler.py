@@ -0,0 +1,135 @@
+# Libraries
+import atexit, json, os, textwrap, threading, time
+from contextlib import contextmanager
+from functools import wraps
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import PROFILEFILE, PROFILEINTERVAL
+
+# Profiler
+# Set profile in .env to a file name to time every stage of the pipeline (loading, the event walk, subVars/resubVars,
+# token counting, waiting on the API, cleanup, textwrap, writing). Durations are kept as histograms per engine and per
+# file and written as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev) with the histograms
+# under "summary" when the tool exits. profileInterval prints the summary every N seconds while it runs.
+# With profile blank the decorators return the function untouched, so there is no overhead.
+
+#Globals
+ENABLED = PROFILEFILE != ''
+MAXEVENTS = 500000  # Trace events kept, histograms keep counting after that
+LOCK = threading.Lock()
+LOCAL = threading.local()
+START = time.perf_counter()
+EVENTS = []
+DURATIONS = {}  # (Scope, Name, Stage) -> [Seconds]
+
+def record(stage, engine, start, end, tid=None):
+    filename = getattr(LOCAL, 'filename', None)
+    with LOCK:
+        DURATIONS.setdefault(('engine', engine, stage), []).append(end - start)
+        if filename is not None:
+            DURATIONS.setdefault(('file', filename, stage), []).append(end - start)
+        if len(EVENTS) < MAXEVENTS:
+            EVENTS.append({
+                'name': stage,
+                'cat': engine,
+                'ph': 'X',
+                'ts': round((start - START) * 1000000, 1),
+                'dur': round((end - start) * 1000000, 1),
+                'pid': os.getpid(),
+                'tid': tid if tid is not None else threading.get_ident(),
+                'args': {'file': filename} if filename is not None else {},
+            })
+
+def profiled(stage, engine=None):
+    def decorator(function):
+        if not ENABLED:
+            return function
+        category = engine if engine is not None else function.__module__.split('.')[-1]
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, category, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+def profiledFile(handler):
+    # Put on handleX(filename, estimate), everything on the same thread is counted towards that file
+    if not ENABLED:
+        return handler
+
+    @wraps(handler)
+    def wrapper(filename, *args, **kwargs):
+        LOCAL.filename = filename
+        start = time.perf_counter()
+        try:
+            return handler(filename, *args, **kwargs)
+        finally:
+            record('file', handler.__module__.split('.')[-1], start, time.perf_counter())
+            LOCAL.filename = None
+    return wrapper
+
+@contextmanager
+def stage(name, engine):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, engine, start, time.perf_counter())
+
+def getHistogram(durations):
+    durations = sorted(durations)
+    percentile = lambda p: durations[min(len(durations) - 1, int(len(durations) * p))]
+    return {
+        'count': len(durations),
+        'total': round(sum(durations), 4),
+        'mean': round(sum(durations) / len(durations), 6),
+        'p50': round(percentile(0.5), 6),
+        'p90': round(percentile(0.9), 6),
+        'p99': round(percentile(0.99), 6),
+        'max': round(durations[-1], 6),
+    }
+
+def getSummary():
+    summary = {'engine': {}, 'file': {}}
+    with LOCK:
+        items = [(key, list(durations)) for key, durations in DURATIONS.items()]
+    for (scope, name, stageName), durations in items:
+        summary[scope].setdefault(name, {})[stageName] = getHistogram(durations)
+    return summary
+
+def getProfileString():
+    lines = [Fore.CYAN + 'Profile:' + Fore.RESET]
+    for engine, stages in sorted(getSummary()['engine'].items()):
+        for stageName, histogram in sorted(stages.items(), key=lambda item: -item[1]['total']):
+            lines.append(f'  {engine + "." + stageName:<34}{histogram["count"]:>9} calls{histogram["total"]:>11.2f}s \
+p50 {histogram["p50"] * 1000:>9.2f}ms p90 {histogram["p90"] * 1000:>9.2f}ms max {histogram["max"] * 1000:>9.2f}ms')
+    return '\n'.join(lines)
+
+def writeProfile():
+    if not ENABLED:
+        return
+    with LOCK:
+        events = list(EVENTS)
+    with open(PROFILEFILE, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'summary': getSummary()}, f)
+    tqdm.write(getProfileString())
+    tqdm.write(Fore.CYAN + f'Profile written to {PROFILEFILE}' + Fore.RESET)
+
+def printSummary():
+    while True:
+        time.sleep(PROFILEINTERVAL)
+        tqdm.write(getProfileString())
+
+if ENABLED:
+    # textwrap is used straight from the standard library by every engine
+    textwrap.fill = profiled('textwrap', 'textwrap')(textwrap.fill)
+    atexit.register(writeProfile)
+    if PROFILEINTERVAL > 0:
+        threading.Thread(target=printSummary, name='profiler', daemon=True).start()
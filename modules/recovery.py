@@ -0,0 +1,92 @@
+# Libraries
+import re
+
+# Mismatch Recovery
+# When the model returns the wrong number of <LineN> tags we used to resend the whole batch and give up if it happened
+# again. Instead, the lines that came back under their own tag are kept and only the missing ones (plus the line
+# in front of each gap, since that's usually where the missing line was merged) are sent again. If the tags can't be
+# trusted at all the batch is split in half and each half is translated on its own, down to single lines.
+
+#Globals
+TAGPATTERN = r'`?<Line(\d+)>.*?</?Line\d+>`?'
+
+def splitLines(translatedText):
+    # Index -> tagged line, None when the same index came back twice
+    segments = {}
+    for match in re.finditer(TAGPATTERN, translatedText):
+        index = int(match.group(1))
+        segments[index] = match.group(0) if index not in segments else None
+    return segments
+
+def recoverBatch(batch, translatedText, retranslate, extractTranslation):
+    # translatedText is whatever cleanTranslatedText returned, a string or a list of lines depending on the engine
+    isList = isinstance(translatedText, list)
+    segments = splitLines('\n'.join(translatedText) if isList else translatedText)
+    extract = lambda segment: extractTranslation([segment] if isList else segment, True)
+    lineCount = len(batch)
+
+    # Tags are trusted if every index is unique, in range and the last line made it back
+    trusted = lineCount - 1 in segments and all(index < lineCount and segment is not None \
+        for index, segment in segments.items())
+    if trusted:
+        missing = [i for i in range(lineCount) if i not in segments]
+        missing = sorted(set(missing + [i - 1 for i in missing if i > 0]))
+        translatedList = [None if i in missing else extract(segments[i]) for i in range(lineCount)]
+        if all(translatedList[i] is not None and len(translatedList[i]) == 1 for i in range(lineCount) \
+            if i not in missing):
+            translatedList = [None if line is None else line[0] for line in translatedList]
+
+            # Only send the lines that are missing
+            if len(missing) == 0:
+                return translatedList
+            if len(missing) < lineCount:
+                subList = translateBatch([batch[i] for i in missing], retranslate, extractTranslation)
+                for i, line in zip(missing, subList):
+                    translatedList[i] = line
+                return translatedList
+
+    # Single line, take the tags that are there or the whole response
+    if lineCount == 1:
+        lines = [extract(segments[index]) for index in sorted(segments) if segments[index] is not None]
+        lines = [line[0] for line in lines if len(line) == 1]
+        if len(lines) > 0:
+            return [' '.join(lines)]
+        response = '\n'.join(translatedText) if isList else translatedText
+        return [response.strip().strip('`')]
+
+    # Split in half
+    half = lineCount // 2
+    return translateBatch(batch[:half], retranslate, extractTranslation) + \
+        translateBatch(batch[half:], retranslate, extractTranslation)
+
+def translateBatch(batch, retranslate, extractTranslation):
+    # Nothing left to translate
+    if not any(re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', str(line)) for line in batch):
+        return list(batch)
+
+    translatedText = retranslate(batch)
+    return recoverBatch(batch, translatedText, retranslate, extractTranslation)
+
+def recoverList(lines, translate):
+    # For callers that only see the list a batch came back as, after translateGPT already tried the above. The lines
+    # are split in half and each half is translated on its own, down to single lines. translate(lines) returns
+    # [Translated Lines, Tokens], so does this, with None for a line that never came back.
+    totalTokens = [0, 0]
+    translatedList = []
+    half = max(1, len(lines) // 2)
+    for part in [lines[:half], lines[half:]]:
+        if len(part) == 0:
+            continue
+        response = translate(part)
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        if len(response[0]) == len(part):
+            translatedList += response[0]
+        elif len(part) == 1:
+            translatedList.append(None)
+        else:
+            response = recoverList(part, translate)
+            totalTokens[0] += response[1][0]
+            totalTokens[1] += response[1][1]
+            translatedList += response[0]
+    return [translatedList, totalTokens]
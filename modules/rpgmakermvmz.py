@@ -1,34 +1,28 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+import hashlib, json, os, re, textwrap, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules.config import MODEL, LANGUAGE, PROMPT, VOCAB, FILETHREADS, THREADS, WIDTH, LISTWIDTH, NOTEWIDTH, \
+    SYSTEMCACHE
+from modules.memory import translationMemory, getMemoryString
+from modules.scheduler import createCompletion
+from modules.profiler import profiled, profiledFile, stage
+from modules.placeholders import compileCodes, maskCodes, unmaskCodes
+from modules.cleanup import compileCleanup, cleanText
+from modules.batchsize import tokenBatches, reportBatch
+from modules.recovery import recoverBatch, recoverList
+from modules.speakers import lookupSpeaker, prefetchSpeakers, unknownNames
+from modules.dedup import isCollecting
+from modules.batch import echoCount, wasEchoed
+from modules.glossary import filterCharacters, filterVocab
+from modules.tokens import countRequest
 
 #Globals
-MODEL = os.getenv('model')
-TIMEOUT = int(os.getenv('timeout'))
-LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
-THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
-WIDTH = int(os.getenv('width'))
-LISTWIDTH = int(os.getenv('listWidth'))
-NOTEWIDTH = int(os.getenv('noteWidth'))
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
@@ -36,6 +30,23 @@ IGNORETLTEXT = True    # Ignores all translated text.
 MISMATCH = []   # Lists files that throw a mismatch error (Length of GPT list response is wrong)
 BRACKETNAMES = False
 PBAR = None
+EXECUTOR = None  # Page workers shared by every file
+SPEAKERS = None  # Speaker names an estimate collects instead of counting, see estimateFile
+DATABASE = None  # [(Instruction, Text) -> Translation, Tokens, First File] for every database file in /files
+DATABASELOCK = threading.Lock()
+DATABASEFILES = ['Actors', 'Armors', 'Weapons', 'Classes', 'Enemies', 'Items', 'MapInfos', 'Skills']
+NOTEREGEXES = [r'<hint:(.*?)>', r'<SGDescription:(.*?)>', r'<SG説明:(.*?)>', r'<SG説明2:(.*?)>', r'<SG説明3:(.*?)>', \
+    r'<SG説明4:(.*?)>', r'<SGカテゴリ:(.*?)>', r'<Switch Shop Description>\n(.*)\n', r'<MapText:(.*?)>']
+SYSTEMTERMS = {     # What each entry of System.json terms is, given to the model as context
+    'basic': ['Level', 'Level (Short)', 'HP', 'HP (Short)', 'MP', 'MP (Short)', 'TP', 'TP (Short)', 'EXP', \
+        'EXP (Short)'],
+    'commands': ['Fight', 'Escape', 'Attack', 'Guard', 'Item', 'Skill', 'Equip', 'Status', 'Formation', 'Save', \
+        'Game End', 'Options', 'Weapon', 'Armor', 'Key Item', 'Equip', 'Optimize', 'Clear', 'New Game', 'Continue', \
+        '', 'To Title', 'Cancel', '', 'Buy', 'Sell'],
+    'params': ['Max HP', 'Max MP', 'Attack', 'Defense', 'M.Attack', 'M.Defense', 'Agility', 'Luck', 'Hit', 'Evasion'],
+}
+CODES = compileCodes('[]', 'Noun')   # Control code placeholders, see modules/placeholders.py
+CLEANUP = compileCleanup(['standard', 'tags', 'quotes', 'honorifics'], LANGUAGE, True)   # See modules/cleanup.py
 
 # Pricing - Depends on the model https://openai.com/pricing
 # Batch Size - GPT 3.5 Struggles past 15 lines per request. GPT4 struggles past 50 lines per request
@@ -80,10 +91,16 @@ CODE324 = False
 CODE111 = False
 CODE108 = False
 
+@profiledFile
 def handleMVMZ(filename, estimate):
     global ESTIMATE, TOKENS
     ESTIMATE = estimate
 
+    # The dedup collect pass only gathers lines, nothing is written, printed or counted
+    if isCollecting():
+        openFiles(filename)
+        return ''
+
     # Translate
     start = time.time()
     translatedData = openFiles(filename)
@@ -91,7 +108,7 @@ def handleMVMZ(filename, estimate):
     # Translate
     if not estimate:
         try:
-            with open('translated/' + filename, 'w', encoding='utf-8') as outFile:
+            with open('translated/' + filename, 'w', encoding='utf-8') as outFile, stage('serialize', 'rpgmakermvmz'):
                 json.dump(translatedData[0], outFile, ensure_ascii=False, indent=4)
         except Exception:
             traceback.print_exc()
@@ -113,6 +130,7 @@ def handleMVMZ(filename, estimate):
     else:
         return totalString
 
+@profiled('load')
 def openFiles(filename):
     with open('files/' + filename, 'r', encoding='utf-8-sig') as f:
         data = json.load(f)
@@ -185,7 +203,7 @@ def getResultString(translatedData, translationTime, filename):
         '[Input: ' + str(translatedData[1][0]) + ']'\
         '[Output: ' + str(translatedData[1][1]) + ']'\
         '[Cost: ${:,.4f}'.format((translatedData[1][0] * .001 * INPUTAPICOST) +\
-        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']'
+        (translatedData[1][1] * .001 * OUTPUTAPICOST)) + ']' + getMemoryString()
     timeString = Fore.BLUE + '[' + str(round(translationTime, 1)) + 's]'
 
     if translatedData[2] is None:
@@ -201,6 +219,80 @@ def getResultString(translatedData, translationTime, filename):
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
 
+# Estimate
+# modules/estimate.py calls estimateFile() for every file, in separate processes. It takes the units the way a
+# translation does (extractPage, getNameUnits, getSystemUnits, getNoteUnits) and counts their batches, nothing is
+# applied or written. Speaker names are only collected and counted once for the project by estimateSpeakers(), the
+# database goes to the first database file (see getDatabase), so the total is the same however the files are split.
+
+def estimateFile(filename):
+    # Returns [Tokens, Speakers]
+    global ESTIMATE, SPEAKERS
+    ESTIMATE = True
+    SPEAKERS = set()
+    totalTokens = [0, 0]
+    pbar = tqdm(disable=True)
+    with open('files/' + filename, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+
+    # Same order openFiles() checks the names in
+    if 'Map' in filename and filename != 'MapInfos.json':
+        response = translateGPT(data['displayName'], 'Reply with only the '+ LANGUAGE +' translation of the RPG location name', False)
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        events = [event for event in data['events'] if event is not None]
+        units = getNoteUnits(events, [r'<namePop:(.*?)\s?>.+'], \
+            'Reply with the '+ LANGUAGE +' translation of the location name.', 'namePop')
+        tokens = translateNameUnits(units, {}, filename)
+        totalTokens[0] += tokens[0]
+        totalTokens[1] += tokens[1]
+        estimatePages([page for event in events for page in event['pages']], pbar, filename, totalTokens)
+    elif 'CommonEvents' in filename:
+        estimatePages(data, pbar, filename, totalTokens)
+    elif getDatabaseContext(filename) is not None:
+        tokens = getDatabase(filename)[1]
+        totalTokens[0] += tokens[0]
+        totalTokens[1] += tokens[1]
+    elif 'Troops' in filename:
+        estimatePages([page for troop in data if troop is not None for page in troop['pages']], pbar, filename, \
+            totalTokens)
+    elif 'States' in filename:
+        units = getNoteUnits([ss for ss in data if ss is not None], [r'<help:([^>]*)>'], \
+            'Reply with only the '+ LANGUAGE +' translation.')
+        tokens = translateNameUnits(units, {}, filename)
+        totalTokens[0] += tokens[0]
+        totalTokens[1] += tokens[1]
+        runJobs(searchSS, [[ss, pbar] for ss in data if ss is not None], totalTokens)
+    elif 'System' in filename:
+        if loadSystem(data['gameTitle'], getSystemKey(data)) is None:
+            tokens = translateNameUnits(getSystemUnits(data), {}, filename)
+            totalTokens[0] += tokens[0]
+            totalTokens[1] += tokens[1]
+    elif 'Scenario' in filename:
+        estimatePages(data.values(), pbar, filename, totalTokens)
+    else:
+        raise NameError(filename + ' Not Supported')
+
+    speakers = sorted(SPEAKERS)
+    SPEAKERS = None
+    return [totalTokens, speakers]
+
+def estimatePages(pages, pbar, filename, totalTokens):
+    # searchPages() without the speaker requests and the apply pass
+    pages = [page for page in pages if page is not None]
+    SPEAKERS.update(findSpeakers(pages))
+    jobs = runJobs(extractPage, [[page, pbar, filename] for page in pages], totalTokens)
+    translateUnits(jobs, filename, totalTokens)
+
+def estimateSpeakers(speakers):
+    # Tokens of the names estimateFile() collected in every file, names already in speakers.json cost nothing
+    global ESTIMATE
+    ESTIMATE = True
+    names = unknownNames(speakers)
+    if len(names) == 0:
+        return [0, 0]
+    return translateSpeakers(names)[1]
+
 def parseMap(data, filename):
     totalTokens = [0, 0]
     totalLines = 0
@@ -220,77 +312,26 @@ def parseMap(data, filename):
             for page in event['pages']:
                 totalLines += len(page['list'])
     
-    # Thread for each page in file
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    # This translates ID of events. (May break the game)
+    index = {}
+    units = getNoteUnits([event for event in events if event is not None], [r'<namePop:(.*?)\s?>.+'], \
+        'Reply with the '+ LANGUAGE +' translation of the location name.', 'namePop')
+    tokens = translateNameUnits(units, index, filename)
+    totalTokens[0] += tokens[0]
+    totalTokens[1] += tokens[1]
+    applyNameUnits(units, index)
+
+    # Pages of every event go into one queue
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            for event in events:
-                if event is not None:
-                    # This translates ID of events. (May break the game)
-                    if '<namePop:' in event['note']:
-                        response = translateNoteOmitSpace(event, r'<namePop:(.*?)\s?>.+')
-                        totalTokens[0] += response[0]
-                        totalTokens[1] += response[1]
-
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in event['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        try:
+            searchPages([page for event in events if event is not None for page in event['pages']], pbar, \
+                filename, totalTokens)
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
-def translateNote(event, regex):
-    # Regex String
-    jaString = event['note']
-    match = re.findall(regex, jaString, re.DOTALL)
-    if match:
-        tokens = [0,0]
-        i = 0
-        while i < len(match):
-            initialJAString = match[i]
-            # Remove any textwrap
-            modifiedJAString = initialJAString.replace('\n', ' ')
-
-            # Translate
-            response = translateGPT(modifiedJAString, 'Reply with only the '+ LANGUAGE +' translation.', False)
-            translatedText = response[0]
-            tokens[0] += response[1][0]
-            tokens[1] += response[1][1]
-
-            # Textwrap
-            translatedText = textwrap.fill(translatedText, width=NOTEWIDTH)
-            translatedText = translatedText.replace('\"', '')
-            jaString = jaString.replace(initialJAString, translatedText)
-            event['note'] = jaString
-            i += 1
-        return tokens
-    return [0,0]
-
-# For notes that can't have spaces.
-def translateNoteOmitSpace(event, regex):
-    # Regex that only matches text inside LB.
-    jaString = event['note']
-
-    match = re.findall(regex, jaString, re.DOTALL)
-    if match:
-        oldJAString = match[0]
-        # Remove any textwrap
-        jaString = re.sub(r'\n', ' ', oldJAString)
-
-        # Translate
-        response = translateGPT(jaString, 'Reply with the '+ LANGUAGE +' translation of the location name.', False)
-        translatedText = response[0]
-
-        translatedText = translatedText.replace('\"', '')
-        translatedText = translatedText.replace(' ', '_')
-        event['note'] = event['note'].replace(oldJAString, translatedText)
-        return response[1]
-    return [0,0]
-
 def parseCommonEvents(data, filename):
     totalTokens = [0, 0]
     totalLines = 0
@@ -301,18 +342,13 @@ def parseCommonEvents(data, filename):
         if page is not None:
             totalLines += len(page['list'])
 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in data if page is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            searchPages(data, pbar, filename, totalTokens)
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseTroops(data, filename):
@@ -326,20 +362,15 @@ def parseTroops(data, filename):
             for page in troop['pages']:
                 totalLines += len(page['list']) + 1 # The +1 is because each page has a name.
 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    # Pages of every troop go into one queue
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        for troop in data:
-            if troop is not None:
-                with ThreadPoolExecutor(max_workers=THREADS) as executor:
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in troop['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        try:
+            searchPages([page for troop in data if troop is not None for page in troop['pages']], pbar, filename, \
+                totalTokens)
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
     
 def parseNames(data, filename, context):
@@ -347,10 +378,10 @@ def parseNames(data, filename, context):
     totalLines = 0
     totalLines += len(data)
                 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
             pbar.desc=filename
             try:
-                result = searchNames(data, pbar, context)       
+                result = searchNames(data, pbar, context, filename)
                 totalTokens[0] += result[0]
                 totalTokens[1] += result[1]
             except Exception as e:
@@ -363,17 +394,23 @@ def parseSS(data, filename):
     totalLines = 0
     totalLines += len(data)
                 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
-            pbar.desc=filename
-            for ss in data:
-                if ss is not None:
-                    try:
-                        result = searchSS(ss, pbar)       
-                        totalTokens[0] += result[0]
-                        totalTokens[1] += result[1]
-                    except Exception as e:
-                        traceback.print_exc()
-                        return [data, totalTokens, e]
+    # Every record goes into one queue on the shared workers
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+        pbar.desc=filename
+        try:
+            # Help tags of every state in one request
+            index = {}
+            units = getNoteUnits([ss for ss in data if ss is not None], [r'<help:([^>]*)>'], \
+                'Reply with only the '+ LANGUAGE +' translation.')
+            tokens = translateNameUnits(units, index, filename)
+            totalTokens[0] += tokens[0]
+            totalTokens[1] += tokens[1]
+            applyNameUnits(units, index)
+
+            runJobs(searchSS, [[ss, pbar] for ss in data if ss is not None], totalTokens)
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseSystem(data, filename):
@@ -391,10 +428,10 @@ def parseSystem(data, filename):
     totalLines += len(data['armorTypes'])
     totalLines += len(data['skillTypes'])
                 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
         try:
-            result = searchSystem(data, pbar)       
+            result = searchSystem(data, pbar, filename)       
             totalTokens[0] += result[0]
             totalTokens[1] += result[1]
         except Exception as e:
@@ -411,287 +448,311 @@ def parseScenario(data, filename):
     for page in data.items():
         totalLines += len(page[1])
 
-    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+    with tqdm(total=totalLines, bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page[1], pbar, [], filename) for page in data.items() if page[1] is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            searchPages(data.values(), pbar, filename, totalTokens)
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
-def searchNames(data, pbar, context):
-    totalTokens = [0, 0]
-    nameList = []
-    profileList = []
-    nicknameList = []
-    descriptionList = []
-    noteList = []
-    i = 0 # Counter
-    j = 0 # Counter 2
-    filling = False
-    mismatch = False
-    batchFull = False
-
-    # Set the context of what we are translating
-    if 'Actors' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the NPC name'
-    if 'Armors' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG equipment name'
-    if 'Classes' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG class name'
-    if 'MapInfos' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the location name'
-    if 'Enemies' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the enemy NPC name'
-    if 'Weapons' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG weapon name'
-    if 'Items' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG item name'
-    if 'Skills' in context:
-        newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG skill name'
-
-    # Names
-    while i < len(data) or filling == True:
-        if i < len(data):
-            # Empty Data
-            if data[i] is None or data[i]['name'] == "":
-                i += 1
-                
-                continue  
-
-            # Filling up Batch
-            filling = True
-            if context in 'Actors':
-                if len(nameList) < BATCHSIZE:
-                    nameList.append(data[i]['name'])
-                    nicknameList.append(data[i]['nickname'])
-                    profileList.append(data[i]['profile'].replace('\n', ' '))
-                    
-                    i += 1
-                else:
-                    batchFull = True
-            if context in ['Armors', 'Weapons', 'Items']:
-                if len(nameList) < BATCHSIZE:
-                    nameList.append(data[i]['name'])
-                    descriptionList.append(data[i]['description'].replace('\n', ' '))
-                    if '<hint:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<hint:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGDescription:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGDescription:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明2:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明2:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明3:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明3:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明4:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明4:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGカテゴリ:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGカテゴリ:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if 'Switch Shop Description' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<Switch Shop Description>\n(.*)\n')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<MapText:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<MapText:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    
-                    i += 1
-                else:
-                    batchFull = True
-            if context in ['Skills']:
-                if len(nameList) < BATCHSIZE:
-                    nameList.append(data[i]['name'])
-                    descriptionList.append(data[i]['description'].replace('\n', ' '))
-                    
-                    # Messages
-                    number = 1
-                    while number < 5:
-                        if f'message{number}' in data[i]:
-                            if len(data[i][f'message{number}']) > 0 and data[i][f'message{number}'][0] in ['は', 'を', 'の', 'に', 'が']:
-                                msgResponse = translateGPT('Taro' + data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-                                data[i][f'message{number}'] = msgResponse[0].replace('Taro', '')
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
+def getExecutor():
+    # Created once and kept for every file, so the workers are busy as long as any page of any file is left
+    global EXECUTOR
+    with LOCK:
+        if EXECUTOR is None:
+            EXECUTOR = ThreadPoolExecutor(max_workers=THREADS * FILETHREADS, thread_name_prefix='mvmz')
+    return EXECUTOR
+
+def searchPages(pages, pbar, filename, totalTokens):
+    # Extract, translate and apply, see below. Pages are translated in place, tokens are added to totalTokens.
+    pages = [page for page in pages if page is not None]
+    speakerTokens = prefetchSpeakers(findSpeakers(pages), translateSpeakers, not ESTIMATE)
+    totalTokens[0] += speakerTokens[0]
+    totalTokens[1] += speakerTokens[1]
+    jobs = runJobs(extractPage, [[page, pbar, filename] for page in pages], totalTokens)
+    translateUnits(jobs, filename, totalTokens)
+    runJobs(applyPage, [[job, pbar, filename] for job in jobs], totalTokens)
+
+def runJobs(function, argsList, totalTokens):
+    # Runs function(*args) for every item on the shared workers, returns the results in order
+    futures = [getExecutor().submit(function, *args) for args in argsList]
+    try:
+        for future in as_completed(futures):
+            totalTokens[0] += future.result()[-1][0]
+            totalTokens[1] += future.result()[-1][1]
+    except Exception:
+        # Drop what hasn't started and let the rest finish before the file is written
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        raise
+    return [future.result() for future in futures]
+
+# Extract / Translate / Apply
+# extractPage() walks a page and collects its dialogue (401/405) and 122 strings without sending them. Those are
+# the units, [Job, Kind, Position, Text] with Kind 0 for dialogue and 1 for scripts. translateUnits() batches the
+# units of every page in the file together, so short pages share requests instead of sending one each, and files
+# the translation under the unit's path. applyPage() walks the page again and puts the translations in place.
+# Estimates run the same way, translateGPT only counts the tokens then.
+# A job is [Page, [Dialogue, Scripts, History], [Translated Dialogue, Translated Scripts], Tokens]
+
+def extractPage(page, pbar, filename):
+    jobList = [[], [], []]
+    totalTokens = searchCodes(page, pbar, jobList, filename)
+    return [page, jobList, [[None] * len(jobList[0]), [None] * len(jobList[1])], totalTokens]
+
+def getUnits(jobs):
+    return [[job, kind, position, text] for job in jobs for kind in [0, 1] \
+        for position, text in enumerate(job[1][kind])]
+
+def translateUnits(jobs, filename, totalTokens):
+    # Dialogue and script strings are never mixed in a request, the history comes from the first page in a batch
+    batches = []
+    for kind in [0, 1]:
+        units = [unit for unit in getUnits(jobs) if unit[1] == kind]
+        position = 0
+        for batch in tokenBatches([unit[3] for unit in units], __name__, BATCHSIZE):
+            batches.append(units[position:position + len(batch)])
+            position += len(batch)
+    results = runJobs(translateBatch, [[batch] for batch in batches], totalTokens)
+
+    # Units go back by path. A batch that came back short is sent again in halves (see recovery.py), a line that
+    # still doesn't come back leaves its kind on its page untouched.
+    for batch, result in zip(batches, results):
+        translatedList = result[0]
+        if len(translatedList) != len(batch):
+            translatedList, tokens = recoverList([unit[3] for unit in batch], \
+                lambda lines: translateGPT(lines, batch[0][0][1][2], True))
+            totalTokens[0] += tokens[0]
+            totalTokens[1] += tokens[1]
+            if None in translatedList:
+                with LOCK:
+                    if filename not in MISMATCH:
+                        MISMATCH.append(filename)
+        for unit, translatedText in zip(batch, translatedList):
+            unit[0][2][unit[1]][unit[2]] = translatedText
+
+def translateBatch(batch):
+    return translateGPT([unit[3] for unit in batch], batch[0][0][1][2], True)
+
+def applyPage(job, pbar, filename):
+    page, jobList, translatedList, totalTokens = job
+    codeList = page['list'] if 'list' in page else page
+
+    # Pass 2, dialogue and scripts are put back on their own once every unit of that kind is translated, a kind
+    # that isn't is passed as None and left as it was. Estimates leave the text as it was, the walk would count what
+    # pass 1 already did again.
+    dialogue = None if None in translatedList[0] else translatedList[0]
+    scripts = None if None in translatedList[1] else translatedList[1]
+    if ESTIMATE or (not dialogue and not scripts):
+        totalTokens = [0, 0]
+    else:
+        totalTokens = searchCodes(page, pbar, [dialogue, scripts, []], filename, True)
 
-                            else:
-                                msgResponse = translateGPT(data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-                                data[i][f'message{number}'] = msgResponse[0]
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
-                        else:
-                            number += 1
-                    
-                    i += 1
-                else:
-                    batchFull = True
-            if context in ['Enemies', 'Classes', 'MapInfos']:
-                if len(nameList) < BATCHSIZE:
-                    nameList.append(data[i]['name'])
-                    
-                    i += 1
-                else:
-                    batchFull = True
-
-        # Batch Full
-        if batchFull == True or i >= len(data):
-            k = j   # Original Index
-            if context in 'Actors':
-                # Name
-                response = translateGPT(nameList, newContext, True)
-                translatedNameBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+    # Delete all -1 codes
+    codeListFinal = [code for code in codeList if 'code' in code and code['code'] != -1]
 
-                # Nickname
-                response = translateGPT(nicknameList, newContext, True)
-                translatedNicknameBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+    # Normal Format
+    if 'list' in page:
+        page['list'] = codeListFinal
 
-                # Profile
-                response = translateGPT(profileList, '', True)
-                translatedProfileBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+    # Special Format (Scenario)
+    else:
+        page[:] = codeListFinal
+    return [page, totalTokens]
+
+# Database
+# The names, nicknames, profiles, descriptions, notes and skill messages of every database file in /files are
+# translated together the first time one of them is opened. Units are grouped by what they are (names with names,
+# descriptions with descriptions) so requests are full batches, and text that shows up in several files is sent
+# once. Each file then takes its translations from that index. While dedup collects, files go one at a time.
+
+def searchNames(data, pbar, context, filename):
+    units = getNameUnits(data, context)
+    if isCollecting():
+        index, totalTokens = {}, [0, 0]
+    else:
+        index, totalTokens = getDatabase(filename)
 
-                # Set Data
-                if len(nameList) == len(translatedNameBatch):
-                    j = k
-                    while j < i:
-                        # Empty Data
-                        if data[j] is None or data[j]['name'] == "":
-                            j += 1
-                            continue 
-                        else:
-                            # Get Text
-                            data[j]['name'] = translatedNameBatch[0]
-                            data[j]['nickname'] = translatedNicknameBatch[0]
-                            data[j]['profile'] = textwrap.fill(translatedProfileBatch[0], LISTWIDTH)
-                            translatedNameBatch.pop(0)
-                            translatedNicknameBatch.pop(0)
-                            translatedProfileBatch.pop(0)
-
-                            # If Batch is empty. Move on.
-                            if len(translatedNameBatch) == 0:
-                                nameList.clear()
-                                filling = False
-                            j += 1
-                else:
-                    mismatch = True
+    # Whatever the database pass didn't get (mismatches)
+    tokens = translateNameUnits(units, index, filename)
+    totalTokens = [totalTokens[0] + tokens[0], totalTokens[1] + tokens[1]]
+    applyNameUnits(units, index)
+    return totalTokens
 
-            if context in ['Armors', 'Weapons', 'Items', 'Skills']:
-                # Name
-                response = translateGPT(nameList, newContext, True)
-                translatedNameBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+def getDatabaseContext(filename):
+    # Same order openFiles() checks the names in
+    if not filename.endswith('.json') or ('Map' in filename and filename != 'MapInfos.json') \
+        or 'CommonEvents' in filename:
+        return None
+    for context in DATABASEFILES:
+        if context in filename:
+            return context
+    return None
+
+def getDatabase(owner):
+    # Returns [Index, Tokens]. The tokens always go to the first database file in /files, so they're counted once
+    # even when estimates open the files in separate processes.
+    global DATABASE
+    with DATABASELOCK:
+        if DATABASE is None:
+            units = []
+            filenames = []
+            for filename in sorted(os.listdir('files')):
+                context = getDatabaseContext(filename)
+                if context is None:
+                    continue
+                try:
+                    with open('files/' + filename, 'r', encoding='utf-8-sig') as f:
+                        units += getNameUnits(json.load(f), context)
+                    filenames.append(filename)
+                except (OSError, ValueError):
+                    # Fails again and is reported when the file itself is opened
+                    continue
+            index = {}
+            tokens = translateNameUnits(units, index, 'Database')
+            DATABASE = [index, tokens, filenames[0] if len(filenames) > 0 else None]
+        index, tokens, first = DATABASE
+        return [index, tokens if owner == first else [0, 0]]
+
+def getNameInstruction(context):
+    match context:
+        case 'Actors':
+            return 'Reply with only the '+ LANGUAGE +' translation of the NPC name'
+        case 'Armors':
+            return 'Reply with only the '+ LANGUAGE +' translation of the RPG equipment name'
+        case 'Classes':
+            return 'Reply with only the '+ LANGUAGE +' translation of the RPG class name'
+        case 'MapInfos':
+            return 'Reply with only the '+ LANGUAGE +' translation of the location name'
+        case 'Enemies':
+            return 'Reply with only the '+ LANGUAGE +' translation of the enemy NPC name'
+        case 'Weapons':
+            return 'Reply with only the '+ LANGUAGE +' translation of the RPG weapon name'
+        case 'Items':
+            return 'Reply with only the '+ LANGUAGE +' translation of the RPG item name'
+        case 'Skills':
+            return 'Reply with only the '+ LANGUAGE +' translation of the RPG skill name'
+
+def getNameUnits(data, context):
+    # [Record, Field, Instruction, Text], Field is a key of the record or a note tag (see getNoteUnits)
+    nameInstruction = getNameInstruction(context)
+    actionInstruction = 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always \
+start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\''
+    units = []
+    for record in data:
+        # Empty Data
+        if record is None or record['name'] == '':
+            continue
 
-                # Description
-                response = translateGPT(descriptionList, f'Reply with only the {LANGUAGE} translation of the text.', True)
-                translatedDescriptionBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+        units.append([record, 'name', nameInstruction, record['name']])
+        if context == 'Actors':
+            units.append([record, 'nickname', nameInstruction, record['nickname']])
+            units.append([record, 'profile', '', record['profile'].replace('\n', ' ')])
+        if context in ['Armors', 'Weapons', 'Items', 'Skills']:
+            units.append([record, 'description', f'Reply with only the {LANGUAGE} translation of the text.', \
+                record['description'].replace('\n', ' ')])
+        if context in ['Armors', 'Weapons', 'Items']:
+            units += getNoteUnits([record], NOTEREGEXES, 'Reply with only the '+ LANGUAGE +' translation.')
+        if context == 'Skills':
+            for number in range(1, 5):
+                message = record.get(f'message{number}', '')
+                if len(message) > 0 and message[0] in ['は', 'を', 'の', 'に', 'が']:
+                    units.append([record, f'message{number}', actionInstruction, 'Taro' + message])
+                elif len(message) > 0:
+                    units.append([record, f'message{number}', 'reply with only the gender neutral '+ LANGUAGE +\
+                        ' translation', message])
+
+    # Text without Japanese is left as it is
+    return [unit for unit in units if isinstance(unit[3], str) and re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', unit[3])]
+
+def getNoteUnits(records, regexes, instruction, tag='note'):
+    # [Record, [Tag, Start, End], Instruction, Text] for every match in the notes, Start and End are the span of the
+    # captured text so it can be put back in place. tag is 'namePop' for tags that can't have spaces.
+    units = []
+    for record in records:
+        for regex in regexes:
+            for match in re.finditer(regex, record['note'], re.DOTALL):
+                if re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', match.group(1)):
+                    units.append([record, [tag, match.start(1), match.end(1)], instruction, \
+                        match.group(1).replace('\n', ' ')])
+    return units
+
+def spliceNotes(notes):
+    # [[Record, Start, End, Text]], spliced back to front so the spans before it stay valid
+    notes.sort(key=lambda note: (id(note[0]), note[1]), reverse=True)
+    end = {}
+    for record, start, stop, text in notes:
+        # Overlapping tags keep the translation that comes last
+        if stop > end.get(id(record), stop):
+            continue
+        record['note'] = record['note'][:start] + text + record['note'][stop:]
+        end[id(record)] = start
+
+def translateNameUnits(units, index, filename):
+    # Sends the text that isn't in index yet, one batch per instruction, and adds the translations to index
+    groups = {}
+    for unit in units:
+        if (unit[2], unit[3]) not in index:
+            groups.setdefault(unit[2], {})[unit[3]] = True
+    batches = [[instruction, batch] for instruction, texts in groups.items() \
+        for batch in tokenBatches(list(texts), __name__, BATCHSIZE)]
+    totalTokens = [0, 0]
+    results = runJobs(translateNameBatch, batches, totalTokens)
+    for (instruction, batch), [translatedList, echoed, tokens] in zip(batches, results):
+        # Echoed in batch mode, left out so nothing is applied or cached (System.json) from it
+        if echoed:
+            continue
+        if len(translatedList) != len(batch):
+            with LOCK:
+                if filename not in MISMATCH:
+                    MISMATCH.append(filename)
+            continue
+        for text, translatedText in zip(batch, translatedList):
+            index[(instruction, text)] = translatedText
+    return totalTokens
 
-                # Set Data
-                if len(nameList) == len(translatedNameBatch):
-                    j = k
-                    while j < i:
-                        # Empty Data
-                        if data[j] is None or data[j]['name'] == "":
-                            j += 1
-                            continue 
-                        else:
-                            # Get Text
-                            data[j]['name'] = translatedNameBatch[0]
-                            data[j]['description'] = textwrap.fill(translatedDescriptionBatch[0], LISTWIDTH)
-                            translatedNameBatch.pop(0)
-                            translatedDescriptionBatch.pop(0)
-
-                            # If Batch is empty. Move on.
-                            if len(translatedNameBatch) == 0:
-                                nameList.clear()
-                                descriptionList.clear()
-                                batchFull = False
-                                filling = False
-                            j += 1
-                else:
-                    mismatch = True
-            if context in ['Enemies', 'Classes', 'MapInfos']:
-                response = translateGPT(nameList, newContext, True)
-                translatedNameBatch = response[0]
-                totalTokens[0] += response[1][0]
-                totalTokens[1] += response[1][1]
+def translateNameBatch(instruction, batch):
+    # Returns [Translations, Echoed, Tokens], runs on the page workers so echoes are checked on this thread
+    since = echoCount()
+    response = translateGPT(batch, instruction, True)
+    return [response[0], wasEchoed(since), response[1]]
+
+def applyNameUnits(units, index):
+    notes = []
+    for record, field, instruction, text in units:
+        translatedText = index.get((instruction, text))
+        if translatedText is None:
+            continue
 
-                # Set Data
-                if len(nameList) == len(translatedNameBatch):
-                    j = k
-                    while j < i:
-                        # Empty Data
-                        if data[j] is None or data[j]['name'] == "":
-                            j += 1
-                            continue 
-                        else:
-                            # Get Text
-                            data[j]['name'] = translatedNameBatch[0]
-                            translatedNameBatch.pop(0)
-
-                            # If Batch is empty. Move on.
-                            if len(translatedNameBatch) == 0:
-                                nameList.clear()
-                                batchFull = False
-                                filling = False
-                            j += 1
-                else:
-                    mismatch = True
-
-            # Mismatch
-            if mismatch == True:
-                MISMATCH.append(nameList)
-                nameList.clear()
-                profileList.clear()
-                descriptionList.clear()
-                filling = False
-                mismatch = False
-                
-                i += 1
+        # Notes
+        if isinstance(field, list) and field[0] == 'namePop':
+            notes.append([record, field[1], field[2], translatedText.replace('\"', '').replace(' ', '_')])
+        elif isinstance(field, list):
+            translatedText = textwrap.fill(translatedText, width=NOTEWIDTH).replace('\"', '')
+            notes.append([record, field[1], field[2], translatedText])
 
-    return totalTokens
+        # Textwrap
+        elif field in ['profile', 'description']:
+            record[field] = textwrap.fill(translatedText, LISTWIDTH)
 
-def searchCodes(page, pbar, jobList, filename):
-    if len(jobList) > 0:
-        docList = jobList[0]
-        scriptList = jobList[1]
-        setData = True
-    else:
-        docList = []
-        scriptList = []
-        setData = False
+        # Action Log
+        elif text.startswith('Taro') and 'action log' in instruction:
+            record[field] = translatedText.replace('Taro', '')
+        else:
+            record[field] = translatedText
+    spliceNotes(notes)
+
+@profiled('searchCodes')
+def searchCodes(page, pbar, jobList, filename, setData=False):
+    # Pass 1 fills jobList [Dialogue, Scripts, History], pass 2 (setData) takes the translations back out of it. In
+    # pass 2 a kind that is None isn't touched.
+    docList = jobList[0]
+    scriptList = jobList[1]
+    textHistory = jobList[2]
     currentGroup = []
-    textHistory = []
     match = []
     totalTokens = [0, 0]
     translatedText = ''
@@ -702,7 +763,6 @@ def searchCodes(page, pbar, jobList, filename):
     CLFlag = False
     maxHistory = MAXHISTORY
     global LOCK
-    global NAMESLIST
     global MISMATCH
     global PBAR
     with LOCK:
@@ -730,7 +790,8 @@ def searchCodes(page, pbar, jobList, filename):
                     break
 
             ## Event Code: 401 Show Text
-            if 'code' in codeList[i] and codeList[i]['code'] in [401, 405, -1] and (CODE401 or CODE405):
+            if 'code' in codeList[i] and codeList[i]['code'] in [401, 405, -1] and (CODE401 or CODE405) \
+                and docList is not None:
                 # Save Code and starting index (j)
                 code = codeList[i]['code']
                 j = i
@@ -1014,7 +1075,7 @@ def searchCodes(page, pbar, jobList, filename):
                             docList.pop(0)                                
 
             ## Event Code: 122 [Set Variables]
-            if 'code' in codeList[i] and codeList[i]['code'] == 122 and CODE122 is True:
+            if 'code' in codeList[i] and codeList[i]['code'] == 122 and CODE122 is True and scriptList is not None:
                 # This is going to be the var being set. (IMPORTANT)
                 if codeList[i]['parameters'][0] not in list(range(0, 20)):
                     i += 1
@@ -1614,8 +1675,6 @@ def searchCodes(page, pbar, jobList, filename):
                         translatedText = translatedTextList[choice]
 
                         # Set Data
-                        totalTokens[0] += response[1][0]
-                        totalTokens[1] += response[1][1]
                         if translatedText != '':
                             translatedText = varList[choice] + translatedText[0].upper() + translatedText[1:]
                         else:
@@ -1697,56 +1756,6 @@ def searchCodes(page, pbar, jobList, filename):
             else:
                 i += 1
 
-        # End of the line
-        docListTL = []
-        scriptListTL = []
-        setData = False
-        PBAR = pbar
-        
-        # 401
-        if len(docList) > 0:
-            response = translateGPT(docList, textHistory, True)
-            docListTL = response[0]
-            totalTokens[0] += response[1][0]
-            totalTokens[1] += response[1][1]
-            if len(docListTL) != len(docList):
-                with LOCK:
-                    if filename not in MISMATCH:
-                        MISMATCH.append(filename)
-            else:
-                setData = True
-
-        # 122
-        if len(scriptList) > 0:
-            response = translateGPT(scriptList, textHistory, True)
-            scriptListTL = response[0]
-            totalTokens[0] += response[1][0]
-            totalTokens[1] += response[1][1]
-            if len(scriptListTL) != len(scriptList):
-                with LOCK:
-                    if filename not in MISMATCH:
-                        MISMATCH.append(filename)
-            else:
-                setData = True
-
-        # Start Pass 2
-        if setData:
-            searchCodes(page, pbar, [docListTL, scriptListTL], filename)
-
-        # Delete all -1 codes
-        codeListFinal = []
-        for i in range(len(codeList)):
-            if 'code' in codeList[i] and codeList[i]['code'] != -1:
-                codeListFinal.append(codeList[i])
-
-        # Normal Format
-        if 'list' in page:
-            page['list'] = codeListFinal
-
-        # Special Format (Scenario)
-        else:
-            page = codeListFinal
-
     except IndexError as e:
         traceback.print_exc()
         raise Exception(str(e) + 'Failed to translate: ' + oldjaString) from None
@@ -1799,11 +1808,6 @@ Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
         else:
             message4Response = translateGPT(state['message4'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
 
-    # if 'note' in state:
-    if 'help' in state['note']:
-        totalTokens[0] += translateNote(state, r'<help:([^>]*)>')[0]
-        totalTokens[1] += translateNote(state, r'<help:([^>]*)>')[1]
-    
     # Count totalTokens
     totalTokens[0] += nameResponse[1][0] if nameResponse != '' else 0
     totalTokens[1] += nameResponse[1][1] if nameResponse != '' else 0
@@ -1836,80 +1840,125 @@ Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
         state['message4'] = message4Response[0].replace('\"', '').replace('Taro', '')
 
     
+    return [state, totalTokens]
+
+# System
+# Every category of System.json (terms, messages, armor/skill/equip types) is one batched request, with the name
+# of each entry given as context. The translated file is kept in system.json by game title, a re-run of the same
+# System.json with the same model, language, prompt and vocab is copied from there without sending anything.
+
+def searchSystem(data, pbar, filename):
+    key = getSystemKey(data)
+    cached = loadSystem(data['gameTitle'], key)
+    if cached is not None:
+        data.clear()
+        data.update(cached)
+        return [0, 0]
+
+    gameTitle = data['gameTitle']
+    units = getSystemUnits(data)
+    index = {}
+    totalTokens = translateNameUnits(units, index, filename)
+    applySystemUnits(units, index, data)
+
+    # Only a complete translation is kept
+    if all((unit[2], unit[3]) in index for unit in units):
+        saveSystem(gameTitle, key, data)
     return totalTokens
 
-def searchSystem(data, pbar):
-    totalTokens = [0, 0]
-    context = 'Reply with only the '+ LANGUAGE +' translation of the UI textbox."'
-
-    # Title
-    response = translateGPT(data['gameTitle'], ' Reply with the '+ LANGUAGE +' translation of the game title name', False)
-    totalTokens[0] += response[1][0]
-    totalTokens[1] += response[1][1]
-    data['gameTitle'] = response[0].strip('.')
-    
-    
-    # Terms
+def getSystemUnits(data):
+    # [Container, Key, Instruction, Text] like getNameUnits, Container is the list or dict the text is in
+    messages = data['terms']['messages']
+    units = getCategoryUnits(data, ['gameTitle'], None, \
+        ' Reply with the '+ LANGUAGE +' translation of the game title name')
     for term in data['terms']:
         if term != 'messages':
             termList = data['terms'][term]
-            for i in range(len(termList)):  # Last item is a messages object
-                if termList[i] is not None:
-                    response = translateGPT(termList[i], context, False)
-                    totalTokens[0] += response[1][0]
-                    totalTokens[1] += response[1][1]
-                    termList[i] = response[0].replace('\"', '').strip()
-                    
-
-    # Armor Types
-    for i in range(len(data['armorTypes'])):
-        response = translateGPT(data['armorTypes'][i], 'Reply with only the '+ LANGUAGE +' translation of the armor type', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['armorTypes'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Skill Types
-    for i in range(len(data['skillTypes'])):
-        response = translateGPT(data['skillTypes'][i], 'Reply with only the '+ LANGUAGE +' translation', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['skillTypes'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Equip Types
-    for i in range(len(data['equipTypes'])):
-        response = translateGPT(data['equipTypes'][i], 'Reply with only the '+ LANGUAGE +' translation of the equipment type. No disclaimers.', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['equipTypes'][i] = response[0].replace('\"', '').strip()
-        
+            names = SYSTEMTERMS.get(term, [])
+            units += getCategoryUnits(termList, range(len(termList)), \
+                [names[i] if i < len(names) and names[i] != '' else f'{term} {i}' for i in range(len(termList))], \
+                'Reply with only the '+ LANGUAGE +f' translation of each UI {term} term.')
+    units += getCategoryUnits(data['armorTypes'], range(len(data['armorTypes'])), None, \
+        'Reply with only the '+ LANGUAGE +' translation of each armor type.')
+    units += getCategoryUnits(data['skillTypes'], range(len(data['skillTypes'])), None, \
+        'Reply with only the '+ LANGUAGE +' translation of each skill type.')
+    units += getCategoryUnits(data['equipTypes'], range(len(data['equipTypes'])), None, \
+        'Reply with only the '+ LANGUAGE +' translation of each equipment type. No disclaimers.')
 
     # Variables (Optional ususally)
-    # for i in range(len(data['variables'])):
-    #     response = translateGPT(data['variables'][i], 'Reply with only the '+ LANGUAGE +' translation of the title', False)
-    #     totalTokens[0] += response[1][0]
-    #     totalTokens[1] += response[1][1]
-    #     data['variables'][i] = response[0].replace('\"', '').strip()
-    #     
+    # units += getCategoryUnits(data['variables'], range(len(data['variables'])), None, \
+    #     'Reply with only the '+ LANGUAGE +' translation of each title.')
 
     # Messages
-    messages = (data['terms']['messages'])
-    for key, value in messages.items():
-        response = translateGPT(value, 'Reply with only the '+ LANGUAGE +' translation of the battle text.\nTranslate "常時ダッシュ" as "Always Dash"\nTranslate "次の%1まで" as Next %1.', False)
-        translatedText = response[0]
+    units += getCategoryUnits(messages, list(messages), list(messages), \
+        'Reply with only the '+ LANGUAGE +' translation of each battle text.\nTranslate "常時ダッシュ" as "Always Dash"\n\
+Translate "次の%1まで" as Next %1.')
+    return units
+
+def getCategoryUnits(container, keys, names, instruction):
+    # names are what each key is (None to leave them out), entries without Japanese are left out
+    entries = [[key, name] for key, name in zip(keys, names if names is not None else keys) \
+        if isinstance(container[key], str) and re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', container[key])]
+    if len(entries) == 0:
+        return []
+    if names is not None:
+        instruction += '\nThe lines are these entries, in order: ' + ', '.join(str(name) for key, name in entries)
+    return [[container, key, instruction, container[key]] for key, name in entries]
+
+def applySystemUnits(units, index, data):
+    messages = data['terms']['messages']
+    for container, key, instruction, text in units:
+        translatedText = index.get((instruction, text))
+        if translatedText is None:
+            continue
+
+        # Title
+        if container is data:
+            container[key] = translatedText.strip('.')
 
         # Remove characters that may break scripts
-        charList = ['.', '\"', '\\n']
-        for char in charList:
-            translatedText = translatedText.replace(char, '')
+        elif container is messages:
+            for char in ['.', '\"', '\\n']:
+                translatedText = translatedText.replace(char, '')
+            container[key] = translatedText
+        else:
+            container[key] = translatedText.replace('\"', '').strip()
 
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        messages[key] = translatedText
-        
-    
-    return totalTokens
+def getSystemKey(data):
+    # Changes whenever the file, model, language, prompt or vocab do
+    source = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1('\x1f'.join([str(MODEL), LANGUAGE, PROMPT, VOCAB, source]).encode('utf-8')).hexdigest()
+
+def loadSystem(gameTitle, key):
+    if SYSTEMCACHE == '' or not os.path.exists(SYSTEMCACHE):
+        return None
+    try:
+        with open(SYSTEMCACHE, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(gameTitle)
+    except (OSError, ValueError) as e:
+        tqdm.write(Fore.YELLOW + f'System: Could not read {SYSTEMCACHE}: {e}' + Fore.RESET)
+        return None
+    if entry is None or entry.get('key') != key:
+        return None
+    return entry['data']
+
+def saveSystem(gameTitle, key, data):
+    # Estimates and dedup collecting aren't translations, echoed batch lines never make it into the index (see
+    # translateNameUnits) so their System.json isn't complete. One entry per game.
+    if SYSTEMCACHE == '' or ESTIMATE or isCollecting():
+        return
+    with LOCK:
+        cache = {}
+        if os.path.exists(SYSTEMCACHE):
+            try:
+                with open(SYSTEMCACHE, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+        cache[gameTitle] = {'key': key, 'data': data}
+        with open(SYSTEMCACHE + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=4)
+        os.replace(SYSTEMCACHE + '.tmp', SYSTEMCACHE)
 
 # Save some money and enter the character before translation
 def getSpeaker(speaker):
@@ -1919,154 +1968,65 @@ def getSpeaker(speaker):
         case '':
             return ['', [0,0]]
         case _:
-            # Store Speaker
-            if speaker not in str(NAMESLIST):
-                response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                response[0] = response[0].title()
-                response[0] = response[0].replace("'S", "'s")
-
-                # Retry if name doesn't translate for some reason
-                if re.search(r'([a-zA-Z？?])', response[0]) == None:
-                    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                    response[0] = response[0].title()
-                    response[0] = response[0].replace("'S", "'s")
-
-                speakerList = [speaker, response[0]]
-                NAMESLIST.append(speakerList)
-                return response
-            # Find Speaker
-            else:
-                for i in range(len(NAMESLIST)):
-                    if speaker == NAMESLIST[i][0]:
-                        return [NAMESLIST[i][1],[0,0]]
-                               
-    return [speaker,[0,0]]
+            # Estimates count every name once for the project, see estimateSpeakers
+            if SPEAKERS is not None:
+                SPEAKERS.add(speaker)
+                return [speaker, [0, 0]]
+
+            # Translated once per name, see modules/speakers.py
+            return lookupSpeaker(speaker, translateSpeaker, not ESTIMATE)
+
+def translateSpeaker(speaker):
+    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+    response[0] = response[0].title()
+    response[0] = response[0].replace("'S", "'s")
+
+    # Retry if name doesn't translate for some reason
+    if re.search(r'([a-zA-Z？?])', response[0]) == None:
+        response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+        response[0] = response[0].title()
+        response[0] = response[0].replace("'S", "'s")
+    return response
 
+def translateSpeakers(speakers):
+    # New names of a file in one request, the ones that don't translate are retried one at a time by getSpeaker
+    response = translateGPT(speakers, 'Reply with the '+ LANGUAGE +' translation of each NPC name.', True)
+    names = [name.title().replace("'S", "'s") if re.search(r'([a-zA-Z？?])', name) else '' for name in response[0]]
+    return [names, response[1]]
+
+def findSpeakers(pages):
+    # Names getSpeaker() will be asked for, found the same way searchCodes finds them
+    speakers = []
+    for page in pages:
+        codeList = page['list'] if 'list' in page else page
+        for i, command in enumerate(codeList):
+            if command.get('code') not in [401, 405] or len(command['parameters']) == 0 \
+                or not isinstance(command['parameters'][0], str):
+                continue
+            jaString = command['parameters'][0]
+            nextIsText = i + 1 < len(codeList) and codeList[i + 1].get('code') in [401, 405]
+            if nextIsText:
+                speakers += re.findall(r'^[\\]+[cC]\[[\d]+\](.+?)[\\]+[Cc]\[[\d]\]\\?\\?$', jaString)
+                speakers += re.findall(r'^【(.*?)】$', jaString)
+            speakers += [match[1] for match in re.findall(r'([\\]+[kKnN][wWcC]?[<](.*?)[>])', jaString)]
+    return [speaker for speaker in speakers if speaker != '' and speaker != 'ファイン']
+
+@profiled('subVars')
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return maskCodes(jaString, CODES)
 
+@profiled('resubVars')
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
-
-    return translatedText
-
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+    return unmaskCodes(translatedText, allList, CODES)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
 グレイス (Grace) - Female\n\
 '
     
-    system = PROMPT + VOCAB if fullPromptFlag else \
+    characters = filterCharacters(characters, subbedT)
+    vocab = filterVocab(VOCAB, subbedT)
+    system = PROMPT + vocab if fullPromptFlag else \
         f"\
 You are an expert Eroge Game translator who translates Japanese text to {LANGUAGE}.\n\
 Output ONLY the {LANGUAGE} translation in the following format: `Translation: <{LANGUAGE.upper()}_TRANSLATION>`\n\
@@ -2077,12 +2037,12 @@ Output ONLY the {LANGUAGE} translation in the following format: `Translation: <{
 - Maintain any spacing in the translation.\n\
 - Maintain any code text in brackets if given. (e.g `[Color_0]`, `[Ascii_0]`, `[FCode_1`], etc)\n\
 - `...` can be a part of the dialogue. Translate it as it is.\n\
-{VOCAB}\n\
+{vocab}\n\
 "
     user = f'{subbedT}'
     return characters, system, user
 
-def translateText(characters, system, user, history, penalty):
+def translateText(characters, system, user, history, penalty, onLine=None):
     # Prompt
     msg = [{"role": "system", "content": system + characters}]
 
@@ -2097,55 +2057,22 @@ def translateText(characters, system, user, history, penalty):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = createCompletion(
         temperature=0,
         frequency_penalty=penalty,
         model=MODEL,
         messages=msg,
+        onLine=onLine,
     )
     return response
 
+@profiled('cleanup')
 def cleanTranslatedText(translatedText, varResponse):
-    placeholders = {
-        f'{LANGUAGE} Translation: ': '',
-        'Translation: ': '',
-        'っ': '',
-        '〜': '~',
-        'ッ': '',
-        '。': '.',
-        '< ': '<',
-        '</ ': '</',
-        ' >': '>',
-        '「': '\"',
-        ' 」': '\"',
-        'Placeholder Text': '',
-        '- chan': '-chan',
-        '- kun': '-kun',
-        '- san': '-san',
-        # Add more replacements as needed
-    }
-    for target, replacement in placeholders.items():
-        translatedText = translatedText.replace(target, replacement)
-
-    # Elongate Long Dashes (Since GPT Ignores them...)
-    translatedText = elongateCharacters(translatedText)
+    translatedText = cleanText(translatedText, CLEANUP)
     translatedText = resubVars(translatedText, varResponse[1])
     return translatedText
 
-def elongateCharacters(text):
-    # Define a pattern to match one character followed by one or more `ー` characters
-    # Using a positive lookbehind assertion to capture the preceding character
-    pattern = r'(?<=(.))ー+'
-    
-    # Define a replacement function that elongates the captured character
-    def repl(match):
-        char = match.group(1)  # The character before the ー sequence
-        count = len(match.group(0)) - 1  # Number of ー characters
-        return char * count  # Replace ー sequence with the character repeated
-
-    # Use re.sub() to replace the pattern in the text
-    return re.sub(pattern, repl, text)
-
+@profiled('extract')
 def extractTranslation(translatedTextList, is_list):
     pattern = r'`?<Line\d+>([\\]*.*?[\\]*?)<\/?Line\d+>`?'
     # If it's a batch (i.e., list), extract with tags; otherwise, return the single item.
@@ -2156,42 +2083,37 @@ def extractTranslation(translatedTextList, is_list):
         matchList = re.findall(pattern, translatedTextList)
         return matchList[0][0] if matchList else translatedTextList
 
+@profiled('countTokens')
 def countTokens(characters, system, user, history):
-    inputTotalTokens = 0
-    outputTotalTokens = 0
-    enc = tiktoken.encoding_for_model('gpt-4')
-    
-    # Input
-    if isinstance(history, list):
-        for line in history:
-            inputTotalTokens += len(enc.encode(line))
-    else:
-        inputTotalTokens += len(enc.encode(history))
-    inputTotalTokens += len(enc.encode(system))
-    inputTotalTokens += len(enc.encode(characters))
-    inputTotalTokens += len(enc.encode(user))
-
-    # Output
-    outputTotalTokens += round(len(enc.encode(user))*3)
-
-    return [inputTotalTokens, outputTotalTokens]
+    return countRequest(characters, system, user, history, 3)
 
 def combineList(tlist, text):
     if isinstance(text, list):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
+@translationMemory
 def translateGPT(text, history, fullPromptFlag):
     global PBAR
     
     mismatch = False
     totalTokens = [0, 0]
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        tList = tokenBatches(text, __name__, BATCHSIZE)
     else:
         tList = [text]
 
+    def retranslate(batch):
+        # Used by recoverBatch to send part of a mismatched batch again
+        payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(batch)])
+        payload = re.sub(r'(<Line\d+)(><)(\/Line\d+>)', r'\1>Placeholder Text<\3', payload)
+        varResponse = subVars(payload)
+        characters, system, user = createContext(fullPromptFlag, varResponse[0])
+        response = translateText(characters, system, user, history, 0.02)
+        totalTokens[0] += response.usage.prompt_tokens
+        totalTokens[1] += response.usage.completion_tokens
+        return cleanTranslatedText(response.choices[0].message.content, varResponse)
+
     for index, tItem in enumerate(tList):
         # Before sending to translation, if we have a list of items, add the formatting
         if isinstance(tItem, list):
@@ -2219,8 +2141,13 @@ def translateGPT(text, history, fullPromptFlag):
             totalTokens[1] += estimate[1]
             continue
 
-        # Translating
-        response = translateText(characters, system, user, history, 0.02)
+        # Translating, streamed lines move the progress bar as soon as they are done
+        streamed = set()
+        def onLine(lineIndex, line):
+            if PBAR is not None and isinstance(tItem, list) and lineIndex not in streamed:
+                streamed.add(lineIndex)
+                PBAR.update(1)
+        response = translateText(characters, system, user, history, 0.02, onLine)
         translatedText = response.choices[0].message.content
         totalTokens[0] += response.usage.prompt_tokens
         totalTokens[1] += response.usage.completion_tokens
@@ -2229,26 +2156,17 @@ def translateGPT(text, history, fullPromptFlag):
         translatedText = cleanTranslatedText(translatedText, varResponse)
         if isinstance(tItem, list):
             extractedTranslations = extractTranslation(translatedText, True)
+            reportBatch(__name__, len(tItem), len(tItem) == len(extractedTranslations))
             tList[index] = extractedTranslations
             if len(tItem) != len(extractedTranslations):
-                # Mismatch. Try Again
-                response = translateText(characters, system, user, history, 0.2)
-                translatedText = response.choices[0].message.content
-                totalTokens[0] += response.usage.prompt_tokens
-                totalTokens[1] += response.usage.completion_tokens
-
-                # Formatting
-                translatedText = cleanTranslatedText(translatedText, varResponse)
-                if isinstance(tItem, list):
-                    extractedTranslations = extractTranslation(translatedText, True)
-                    tList[index] = extractedTranslations
-                    if len(tItem) != len(extractedTranslations):
-                        mismatch = True # Just here for breakpoint
+                # Mismatch. Keep the lines that came back and only send the rest again
+                extractedTranslations = recoverBatch(tItem, translatedText, retranslate, extractTranslation)
+                tList[index] = extractedTranslations
 
             # Create History
             with LOCK:
                 if PBAR is not None:
-                    PBAR.update(len(tItem))
+                    PBAR.update(len(tItem) - len(streamed))
             if not mismatch:
                 history = extractedTranslations[-10:]  # Update history if we have a list
             else:
@@ -1,38 +1,22 @@
-import os
 import re
 import textwrap
 import threading
 import time
 import traceback
-from pathlib import Path
 
-import openai
 import tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv("api").replace(" ", "") != "":
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv("org")
-openai.api_key = os.getenv("key")
+from modules.config import MODEL, LANGUAGE, PROMPT, WIDTH
+from modules.memory import translationMemory, getMemoryString
+from modules.scheduler import createCompletion
+from modules.profiler import profiled, profiledFile
+from modules.dedup import isCollecting
 
 # Globals
-MODEL = os.getenv("model")
-TIMEOUT = int(os.getenv("timeout"))
-LANGUAGE = os.getenv("language").capitalize()
 INPUTAPICOST = 0.002  # Depends on the model https://openai.com/pricing
 OUTPUTAPICOST = 0.002
-PROMPT = Path("prompt.txt").read_text(encoding="utf-8")
-THREADS = int(
-    os.getenv("threads")
-)  # Controls how many threads are working on a single file (May have to drop this)
 LOCK = threading.Lock()
-WIDTH = int(os.getenv("width"))
-LISTWIDTH = int(os.getenv("listWidth"))
 NOTEWIDTH = 40
 MAXHISTORY = 10
 ESTIMATE = ""
@@ -51,11 +35,17 @@ FIXTEXTWRAP = True
 IGNORETLTEXT = False
 
 
+@profiledFile
 def handleSakuranbo(filename, estimate):
     global ESTIMATE
     totalTokens = [0, 0]
     ESTIMATE = estimate
 
+    # The dedup collect pass only gathers lines, nothing is written, printed or counted
+    if isCollecting():
+        openFiles(filename)
+        return ''
+
     if estimate:
         start = time.time()
         translatedData = openFiles(filename)
@@ -101,6 +91,7 @@ def getResultString(translatedData, translationTime, filename):
             + (translatedData[1][1] * 0.001 * OUTPUTAPICOST)
         )
         + "]"
+        + getMemoryString()
     )
     timeString = Fore.BLUE + "[" + str(round(translationTime, 1)) + "s]"
 
@@ -134,6 +125,7 @@ def getResultString(translatedData, translationTime, filename):
             )
 
 
+@profiled('load')
 def openFiles(filename):
     with open("files/" + filename, "r", encoding="utf-16") as readFile:
         translatedData = parseTyrano(readFile, filename)
@@ -418,6 +410,7 @@ def translateTyrano(data, pbar):
 
     return tokens
 
+@profiled('subVars')
 def subVars(jaString):
     jaString = jaString.replace("\u3000", " ")
 
@@ -482,6 +475,7 @@ def subVars(jaString):
     return [jaString, allList]
 
 
+@profiled('resubVars')
 def resubVars(translatedText, allList):
     # Fix Spacing and ChatGPT Nonsense
     matchList = re.findall(r"\[\s?.+?\s?\]", translatedText)
@@ -539,7 +533,7 @@ def resubVars(translatedText, allList):
     return translatedText
 
 
-@retry(exceptions=Exception, tries=5, delay=5)
+@translationMemory
 def translateGPT(t, history, fullPromptFlag):
     # Sub Vars
     varResponse = subVars(t)
@@ -596,13 +590,12 @@ def translateGPT(t, history, fullPromptFlag):
         msg.append({"role": "user", "content": history})
     msg.append({"role": "user", "content": user})
 
-    response = openai.ChatCompletion.create(
+    response = createCompletion(
         temperature=0,
         frequency_penalty=0.2,
         presence_penalty=0.2,
         model=MODEL,
         messages=msg,
-        request_timeout=TIMEOUT,
     )
 
     # Save Translated Text
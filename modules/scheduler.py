@@ -0,0 +1,191 @@
+# Libraries
+import asyncio, random, re, threading, time
+import openai
+from openai import AsyncOpenAI
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import API, KEY, ORGANIZATION, TIMEOUT, MAXREQUESTS, REQUESTSPERMINUTE, TOKENSPERMINUTE, \
+    MAXRETRIES, STREAM
+from modules.batch import inBatchMode, batchCompletion, toResponse
+from modules.stream import newParser, feedParser, getReply
+from modules.tokens import countText, recordCompletion
+from modules.journal import recordRequest, replayRequest
+from modules.profiler import ENABLED, profiled, record
+
+# Request Scheduler
+# Every engine module sends its chat completions through createCompletion(). The requests run on a single asyncio
+# loop with one AsyncOpenAI client, so the number of requests in flight is capped by maxRequests no matter how many
+# fileThreads/threads are producing work. A token bucket keeps us under requestsPerMinute and tokensPerMinute.
+# Failed calls are retried here, one request at a time, so a failure late in a file doesn't resend the whole file.
+# With stream enabled replies are read as they are generated and cut off early when they go wrong (see stream.py).
+
+#Globals
+MAXBACKOFF = 60
+LOCK = threading.Lock()
+LOOP = None
+CLIENT = None
+SEMAPHORE = None
+BUCKETS = {
+    'requests': [REQUESTSPERMINUTE, REQUESTSPERMINUTE, time.monotonic()],   # [Capacity, Available, Last Refill]
+    'tokens': [TOKENSPERMINUTE, TOKENSPERMINUTE, time.monotonic()],
+}
+
+def startScheduler():
+    global LOOP, CLIENT, SEMAPHORE
+    with LOCK:
+        if LOOP is None:
+            LOOP = asyncio.new_event_loop()
+            threading.Thread(target=LOOP.run_forever, name='scheduler', daemon=True).start()
+
+            # Client
+            CLIENT = AsyncOpenAI(
+                api_key=KEY,
+                organization=ORGANIZATION,
+                base_url=API if API != '' else None,
+                timeout=TIMEOUT,
+                max_retries=0,
+            )
+            SEMAPHORE = asyncio.Semaphore(MAXREQUESTS)
+    return LOOP
+
+def estimateTokens(messages):
+    # Prompt plus roughly the same again for the reply
+    inputTokens = sum(countText(str(message['content'])) for message in messages)
+    outputTokens = countText(str(messages[-1]['content']))
+    return inputTokens + outputTokens
+
+def refillBucket(name):
+    bucket = BUCKETS[name]
+    now = time.monotonic()
+    bucket[1] = min(bucket[0], bucket[1] + (now - bucket[2]) * bucket[0] / 60)
+    bucket[2] = now
+    return bucket
+
+async def acquire(tokens):
+    # Wait until both buckets have room
+    while True:
+        requestBucket = refillBucket('requests')
+        tokenBucket = refillBucket('tokens')
+        tokens = min(tokens, tokenBucket[0])
+        if requestBucket[1] >= 1 and tokenBucket[1] >= tokens:
+            requestBucket[1] -= 1
+            tokenBucket[1] -= tokens
+            return tokens
+
+        waitRequests = (1 - requestBucket[1]) * 60 / requestBucket[0]
+        waitTokens = (tokens - tokenBucket[1]) * 60 / tokenBucket[0]
+        await asyncio.sleep(max(waitRequests, waitTokens, 0.01))
+
+def isRetryable(error):
+    # Rate limits, server errors and timeouts go away on their own, bad requests and auth errors don't
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.RateLimitError):
+        return error.code != 'insufficient_quota'
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in [408, 409] or error.status_code >= 500
+    return False
+
+def parseDuration(value):
+    # Retry-After is in seconds, x-ratelimit-reset-* looks like 1s, 250ms or 6m0s
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    parts = re.findall(r'([\d.]+)(ms|h|m|s)', value)
+    if len(parts) == 0:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+def getRetryDelay(error, attempt):
+    # Exponential backoff with full jitter, unless the server tells us how long to wait
+    delay = random.uniform(0, min(MAXBACKOFF, 2 ** attempt))
+    response = getattr(error, 'response', None)
+    if response is not None:
+        headers = response.headers
+        waits = [parseDuration(headers.get('retry-after-ms')), parseDuration(headers.get('retry-after'))]
+        if waits[0] is not None:
+            waits[0] = waits[0] / 1000
+        if isinstance(error, openai.RateLimitError):
+            waits.append(parseDuration(headers.get('x-ratelimit-reset-requests')))
+            waits.append(parseDuration(headers.get('x-ratelimit-reset-tokens')))
+        waits = [wait for wait in waits if wait is not None]
+        if len(waits) > 0:
+            delay = min(MAXBACKOFF, max(waits)) + random.uniform(0, 1)
+    return delay
+
+async def streamCompletion(kwargs, onLine):
+    parser = newParser(str(kwargs['messages'][-1]['content']), onLine)
+    stream = await CLIENT.chat.completions.create(stream=True, **kwargs)
+    error = None
+    async for chunk in stream:
+        if len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+            error = feedParser(parser, chunk.choices[0].delta.content)
+            if error is not None:
+                # Stop paying for a reply that went wrong
+                await stream.response.aclose()
+                tqdm.write(Fore.YELLOW + 'Stream cancelled: ' + error + Fore.RESET)
+                break
+
+    # Streams don't report usage, so count it
+    content = getReply(parser, error is not None)
+    promptTokens = sum(countText(str(message['content'])) for message in kwargs['messages'])
+    completionTokens = countText(parser[1])
+    return toResponse({
+        'choices': [{'message': {'content': content}}],
+        'usage': {'prompt_tokens': promptTokens, 'completion_tokens': completionTokens, \
+            'total_tokens': promptTokens + completionTokens},
+    })
+
+async def complete(kwargs, onLine):
+    for attempt in range(MAXRETRIES + 1):
+        queued = time.perf_counter()
+        tokens = await acquire(estimateTokens(kwargs['messages']))
+        try:
+            async with SEMAPHORE:
+                # Time spent waiting on the rate limit and for a free slot
+                if ENABLED:
+                    record('queue', 'scheduler', queued, time.perf_counter())
+                if STREAM:
+                    response = await streamCompletion(kwargs, onLine)
+                else:
+                    response = await CLIENT.chat.completions.create(**kwargs)
+        except Exception as e:
+            if not isRetryable(e) or attempt == MAXRETRIES:
+                raise
+            delay = getRetryDelay(e, attempt)
+            tqdm.write(Fore.YELLOW + f'{type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{MAXRETRIES})' \
+                + Fore.RESET)
+            await asyncio.sleep(delay)
+            continue
+
+        # Settle the bucket with what was actually used
+        if response.usage is not None:
+            BUCKETS['tokens'][1] -= response.usage.total_tokens - tokens
+        return response
+
+@profiled('api')
+def createCompletion(**kwargs):
+    # Called with (index, text) for every line of a streamed reply as soon as it's done
+    onLine = kwargs.pop('onLine', None)
+
+    # Offline, requests are written to a file instead
+    if inBatchMode():
+        return batchCompletion(kwargs)
+
+    # Answered before the last run stopped
+    response = replayRequest(kwargs)
+    if response is not None:
+        return response
+
+    loop = startScheduler()
+    response = asyncio.run_coroutine_threadsafe(complete(kwargs, onLine), loop).result()
+    recordRequest(kwargs, response)
+
+    # How long replies are compared to the text, estimates are calibrated with this
+    if response.usage is not None:
+        recordCompletion(kwargs['messages'][-1]['content'], response.usage.completion_tokens)
+    return response
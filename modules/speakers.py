@@ -0,0 +1,145 @@
+# Libraries
+import json, os, threading
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import LANGUAGE, SPEAKERFILE
+from modules.batch import echoCount, wasEchoed
+from modules.dedup import isCollecting, onCollected
+
+# Speaker Registry
+# Speaker names come up in almost every dialogue block. The registry keeps the translated names in a dict and only
+# sends a name the first time it's seen. When several threads hit the same new name at once one of them translates
+# it and the others wait for that answer instead of paying for it again. Names are saved to speakers.json so the
+# next run knows them from the first line, delete a name from the file to have it translated again.
+
+#Globals
+LOCK = threading.Lock()
+NAMES = None    # Japanese Name -> Translated Name
+UNSAVED = {}    # Names seen in an estimate, only counted once and never saved
+TRANSLATED = set()  # Names that already are translations, text is walked again after it's translated
+INFLIGHT = {}   # Japanese Name -> Event set once its translation is done
+CACHES = []     # Speaker lists engines keep themselves, see registerNames
+
+def registerNames(cache):
+    # Engines that keep their own list of speaker names register it here, it's emptied after dedup collects
+    CACHES.append(cache)
+    return cache
+
+def resetNames():
+    # Names cached while dedup collected are still untranslated
+    with LOCK:
+        for cache in CACHES:
+            cache.clear()
+
+onCollected(resetNames)
+
+def loadNames():
+    global NAMES
+    if NAMES is None:
+        NAMES = {}
+        if SPEAKERFILE != '' and os.path.exists(SPEAKERFILE):
+            try:
+                with open(SPEAKERFILE, 'r', encoding='utf-8') as f:
+                    NAMES = json.load(f).get(LANGUAGE, {})
+                TRANSLATED.update(NAMES.values())
+            except (OSError, ValueError) as e:
+                tqdm.write(Fore.YELLOW + f'Speakers: Could not read {SPEAKERFILE}, starting empty: {e}' + Fore.RESET)
+    return NAMES
+
+def saveNames():
+    # Called with LOCK held, written to a temp file first so a crash can't leave half a file
+    if SPEAKERFILE == '':
+        return
+    data = {}
+    if os.path.exists(SPEAKERFILE):
+        try:
+            with open(SPEAKERFILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    data[LANGUAGE] = NAMES
+    with open(SPEAKERFILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(SPEAKERFILE + '.tmp', SPEAKERFILE)
+
+def findName(speaker):
+    # Called with LOCK held
+    names = loadNames()
+    if speaker in names:
+        return names[speaker]
+    if speaker in TRANSLATED:
+        return speaker
+    return UNSAVED.get(speaker)
+
+def storeNames(names, save, since):
+    # Names given back while collecting for dedup or echoed in batch mode (since is echoCount() before sending) are
+    # still Japanese
+    if isCollecting() or wasEchoed(since) or len(names) == 0:
+        return
+    with LOCK:
+        TRANSLATED.update(names.values())
+        if not save:
+            UNSAVED.update(names)
+            return
+        loadNames().update(names)
+        saveNames()
+
+def claimNames(speakers):
+    # Returns the names this thread has to translate, those already known or in flight are left out
+    claimed = []
+    with LOCK:
+        for speaker in speakers:
+            if findName(speaker) is None and speaker not in INFLIGHT:
+                INFLIGHT[speaker] = threading.Event()
+                claimed.append(speaker)
+    return claimed
+
+def unknownNames(speakers):
+    # Returns the names that would still be sent, in the order given
+    with LOCK:
+        return [speaker for speaker in dict.fromkeys(speakers) if findName(speaker) is None]
+
+def releaseNames(speakers):
+    with LOCK:
+        events = [INFLIGHT.pop(speaker) for speaker in speakers if speaker in INFLIGHT]
+    for event in events:
+        event.set()
+
+def lookupSpeaker(speaker, translate, save=True):
+    # translate(speaker) -> [Name, Tokens] runs once per unseen name, returns [Name, Tokens].
+    # save is False for estimates, the name is then only remembered for this run.
+    while True:
+        with LOCK:
+            name = findName(speaker)
+            if name is not None:
+                return [name, [0, 0]]
+            event = INFLIGHT.get(speaker)
+            if event is None:
+                event = INFLIGHT[speaker] = threading.Event()
+                break
+
+        # Someone else is translating it, if they failed the loop claims it
+        event.wait()
+
+    try:
+        since = echoCount()
+        response = translate(speaker)
+        storeNames({speaker: response[0]}, save, since)
+        return response
+    finally:
+        releaseNames([speaker])
+
+def prefetchSpeakers(speakers, translateList, save=True):
+    # translateList(names) -> [[Name, ...], Tokens] translates all new names in one go, returns the tokens.
+    # Names that come back empty are left for lookupSpeaker to do one at a time.
+    claimed = claimNames(list(dict.fromkeys(speakers)))
+    if len(claimed) == 0:
+        return [0, 0]
+    try:
+        since = echoCount()
+        response = translateList(claimed)
+        if len(response[0]) == len(claimed):
+            storeNames({speaker: name for speaker, name in zip(claimed, response[0]) if name}, save, since)
+        return response[1]
+    finally:
+        releaseNames(claimed)
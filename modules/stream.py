@@ -0,0 +1,57 @@
+# Libraries
+import re
+
+# Streaming
+# With stream enabled the reply is read as it is generated. Every <LineN> tag is handed over as soon as it closes
+# so the progress bar moves line by line, and replies that went wrong are cut off early instead of running until
+# max tokens. A reply is cut off when a line runs far longer than the line it translates or when the tags
+# start over or go past the lines that were sent. Skipped lines are left to recoverBatch.
+
+#Globals
+TAGPATTERN = re.compile(r'<Line(\d+)>(.*?)</?Line\d+>')
+OPENPATTERN = re.compile(r'<Line(\d+)>')
+RUNAWAY = 4     # A reply may be this many times as long as the text it translates
+SLACK = 200
+
+def newParser(content, onLine):
+    # [Source Lines, Reply, Parsed Up To, Next Line, Callback]
+    source = {int(index): line for index, line in TAGPATTERN.findall(content)}
+    if len(source) == 0:
+        source = {None: content}
+    return [source, '', 0, 0, onLine]
+
+def feedParser(parser, delta):
+    source = parser[0]
+    parser[1] += delta
+
+    # Untagged, only the length can be checked
+    if None in source:
+        if len(parser[1]) > RUNAWAY * len(source[None]) + SLACK:
+            return 'Reply is much longer than the text'
+        return None
+
+    # Hand over every line that closed
+    for match in TAGPATTERN.finditer(parser[1], parser[2]):
+        index = int(match.group(1))
+        if index < parser[3]:
+            return f'Line{index} came back twice'
+        if index not in source:
+            return f'Line{index} was never sent'
+        parser[2] = match.end()
+        parser[3] = index + 1
+        if parser[4] is not None:
+            parser[4](index, match.group(2))
+
+    # Line that is still open
+    pending = parser[1][parser[2]:]
+    match = OPENPATTERN.search(pending)
+    sourceLength = len(source.get(int(match.group(1)), '')) if match else 0
+    if len(pending) > RUNAWAY * sourceLength + SLACK:
+        return 'Line' + (match.group(1) if match else str(parser[3])) + ' never ends'
+    return None
+
+def getReply(parser, cancelled):
+    # Drop the unfinished line of a reply that was cut off
+    if cancelled and parser[2] > 0:
+        return parser[1][:parser[2]]
+    return parser[1]
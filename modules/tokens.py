@@ -0,0 +1,128 @@
+# Libraries
+import atexit, json, os, threading, tiktoken
+from functools import lru_cache
+from colorama import Fore
+from tqdm import tqdm
+from modules.config import MODEL, LANGUAGE, CALIBRATIONFILE
+from modules.profiler import profiled
+
+# Token Counting
+# Loading the tiktoken encoder is slow, so it is loaded once and shared by everything that counts tokens.
+# If it can't be loaded (no cached encoding and no internet) tokens are approximated from the text length instead.
+# The prompt, vocab and character list are the same for most requests, their counts are remembered by text so they
+# are only encoded once. The rest of a request (the text and its history) is encoded text by text, a request has too
+# few of them for encode_batch and its thread pool to pay off.
+# How long the reply will be is learned from the requests that were actually sent: the completion tokens the API
+# reported against the tokens of the text, per model and language, kept in calibration.json. Until enough requests
+# were seen the engine's fixed ratio is used.
+#
+#   return countRequest(characters, system, user, history, 3)
+
+#Globals
+LOCK = threading.Lock()
+ENCODER = None
+CALIBRATIONKEY = f'{MODEL}|{LANGUAGE}'
+CALIBRATIONLOCK = threading.Lock()
+CALIBRATION = None  # Model|Language -> [Text Tokens, Completion Tokens, Requests]
+CHANGED = False
+MINREQUESTS = 20
+MAXSAMPLE = 2000000 # Text tokens kept per key, past that older runs count for half
+
+def getEncoder():
+    global ENCODER
+    if ENCODER is not None:
+        return ENCODER
+    with LOCK:
+        if ENCODER is None:
+            try:
+                ENCODER = tiktoken.encoding_for_model('gpt-4')
+            except Exception as e:
+                tqdm.write(Fore.YELLOW + 'Tiktoken unavailable, approximating tokens: ' + str(e)[:100] + Fore.RESET)
+                ENCODER = False
+    return ENCODER
+
+def approximate(text):
+    return len(text.encode('utf-8')) // 3 + 1
+
+@profiled('tokens')
+def countText(text):
+    encoder = getEncoder()
+    if encoder is False:
+        return approximate(text)
+    return len(encoder.encode(text))
+
+@lru_cache(maxsize=4096)
+def countStatic(text):
+    # For text that repeats between requests
+    return countText(text)
+
+@profiled('tokens')
+def countBatch(texts):
+    encoder = getEncoder()
+    if encoder is False:
+        return [approximate(text) for text in texts]
+    return [len(encoder.encode(text)) for text in texts]
+
+def countRequest(characters, system, user, history, ratio):
+    # Returns [Input Tokens, Output Tokens] of a request, ratio is used for the output until it's calibrated
+    if not isinstance(history, list):
+        history = [history]
+    counts = countBatch([user] + history)
+    inputTokens = countStatic(system) + countStatic(characters) + sum(counts)
+    return [inputTokens, round(counts[0] * getOutputRatio(ratio))]
+
+def loadCalibration():
+    # Called with CALIBRATIONLOCK held
+    global CALIBRATION
+    if CALIBRATION is None:
+        CALIBRATION = {}
+        if CALIBRATIONFILE != '' and os.path.exists(CALIBRATIONFILE):
+            try:
+                with open(CALIBRATIONFILE, 'r', encoding='utf-8') as f:
+                    CALIBRATION = json.load(f)
+            except (OSError, ValueError) as e:
+                tqdm.write(Fore.YELLOW + f'Tokens: Could not read {CALIBRATIONFILE}, starting empty: {e}' + Fore.RESET)
+    return CALIBRATION
+
+def saveCalibration():
+    # Only this key is written, other models and languages in the file are kept
+    with CALIBRATIONLOCK:
+        data = {}
+        if os.path.exists(CALIBRATIONFILE):
+            try:
+                with open(CALIBRATIONFILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[CALIBRATIONKEY] = CALIBRATION[CALIBRATIONKEY]
+        with open(CALIBRATIONFILE + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        os.replace(CALIBRATIONFILE + '.tmp', CALIBRATIONFILE)
+
+def recordCompletion(user, completionTokens):
+    # Called for every reply from the API, saved when the tool exits
+    if CALIBRATIONFILE == '':
+        return
+    global CHANGED
+    textTokens = countText(str(user))
+    with CALIBRATIONLOCK:
+        if not CHANGED:
+            atexit.register(saveCalibration)
+            CHANGED = True
+        calibration = loadCalibration()
+        sample = calibration.setdefault(CALIBRATIONKEY, [0, 0, 0])
+        sample[0] += textTokens
+        sample[1] += completionTokens
+        sample[2] += 1
+        if sample[0] > MAXSAMPLE:
+            calibration[CALIBRATIONKEY] = [sample[0] // 2, sample[1] // 2, sample[2]]
+
+def getOutputRatio(ratio):
+    # Completion tokens per token of text
+    if CALIBRATIONFILE == '':
+        return ratio
+    with CALIBRATIONLOCK:
+        sample = loadCalibration().get(CALIBRATIONKEY)
+    if sample is None or sample[2] < MINREQUESTS or sample[0] == 0:
+        return ratio
+    return sample[1] / sample[0]
@@ -1,3 +1,4 @@
-from modules.automated import main
-
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    # Estimates start worker processes that import this file again
+    from modules.automated import main
+    main()
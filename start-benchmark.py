@@ -0,0 +1,3 @@
+from modules.benchmark import main
+
+main()
\ No newline at end of file
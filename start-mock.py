@@ -0,0 +1,3 @@
+from modules.mockserver import main
+
+main()
\ No newline at end of file
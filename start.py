@@ -1,3 +1,4 @@
-from modules.main import main
-
-main()
+if __name__ == '__main__':
+    # Estimates start worker processes that import this file again
+    from modules.main import main
+    main()
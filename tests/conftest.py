@@ -0,0 +1,29 @@
+# Libraries
+import importlib, os, sys
+import pytest
+
+# Fixtures
+# The modules read .env, prompt.txt and vocab.txt when they are imported, so they are imported fresh inside a scratch
+# folder with their own settings.
+
+#Globals
+ENV = {'api': '', 'key': 'test', 'organization': 'test', 'model': 'gpt-4o', 'language': 'English', 'timeout': '30', \
+    'fileThreads': '1', 'threads': '1', 'width': '60', 'listWidth': '100', 'memory': '', 'journal': '', \
+    'speakers': '', 'systemCache': '', 'calibration': '', 'batchSizes': '', 'dedup': 'True'}
+
+@pytest.fixture
+def loadModules(tmp_path, monkeypatch):
+    # load(['dedup', 'memory'], {'memory': 'memory.db'}) returns the modules
+    for name in ['prompt.txt', 'vocab.txt']:
+        (tmp_path / name).write_text('', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def load(names, env={}):
+        for key, value in {**ENV, **env}.items():
+            monkeypatch.setenv(key, value)
+        for name in [name for name in sys.modules if name.startswith('modules')]:
+            del sys.modules[name]
+        return [importlib.import_module('modules.' + name) for name in names]
+    yield load
+    sys.path.pop(0)
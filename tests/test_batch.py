@@ -0,0 +1,55 @@
+# Libraries
+import pytest
+
+# Batch Mode
+# A translateGPT call can be several requests. When one of them is echoed back in batch mode and a later one is
+# answered, nothing of that call may be kept as a translation.
+
+#Globals
+ESTIMATE = False
+
+@pytest.fixture
+def modules(loadModules):
+    batch, memory, speakers, scheduler = loadModules(['batch', 'memory', 'speakers', 'scheduler'], \
+        {'memory': 'memory.db', 'speakers': 'speakers.json'})
+    batch.startBatch()
+    return [batch, memory, speakers, scheduler.createCompletion]
+
+def getRequest(text):
+    return {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': text}]}
+
+def complete(createCompletion, text):
+    return createCompletion(**getRequest(text)).choices[0].message.content
+
+def test_memory_skips_call_with_echoed_request(modules):
+    batch, memory, speakers, createCompletion = modules
+
+    # The second request was answered in an earlier round, the first one is echoed and then cleaned up
+    batch.RESULTS[batch.requestID(getRequest('ようやく。'))] = {'choices': [{'message': {'content': 'Finally.'}}]}
+
+    def translateGPT(text, history, fullPromptFlag):
+        return [[complete(createCompletion, line).replace('っ', '') for line in text], [10, 10]]
+
+    wrapper = memory.translationMemory(translateGPT)
+    assert wrapper(['やっと来た。', 'ようやく。'], [], True)[0] == ['やと来た。', 'Finally.']
+    keys = [memory.memoryKey(line, [], True) for line in ['やっと来た。', 'ようやく。']]
+    assert memory.getMemory(keys) == {}
+
+def test_echo_on_other_call_is_not_seen(modules):
+    batch, memory, speakers, createCompletion = modules
+    complete(createCompletion, '村人')
+    assert speakers.lookupSpeaker('勇者', lambda speaker: ['Hero', [10, 10]]) == ['Hero', [10, 10]]
+    assert speakers.lookupSpeaker('勇者', lambda speaker: ['Wrong', [10, 10]]) == ['Hero', [0, 0]]
+
+def test_speaker_echoed_is_not_stored(modules):
+    batch, memory, speakers, createCompletion = modules
+    response = speakers.lookupSpeaker('村人', lambda speaker: [complete(createCompletion, speaker), [10, 10]])
+    assert response[0] == '村人'
+    assert speakers.lookupSpeaker('村人', lambda speaker: ['Villager', [10, 10]]) == ['Villager', [10, 10]]
+
+def test_request_id_covers_history(modules):
+    batch, memory, speakers, createCompletion = modules
+    request = getRequest('ようやく。')
+    history = {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'やっと来た。'}] + request['messages']}
+    assert batch.requestID(request) != batch.requestID(history)
+    assert batch.requestID(history) == batch.requestID(dict(reversed(list(history.items()))))
@@ -0,0 +1,60 @@
+# Libraries
+import json, pytest
+
+# Dedup
+# The collect pass of dedupProject must never send anything when the translation memory is off, and must not write,
+# print or count anything for the files it runs through.
+
+#Globals
+SENT = []
+ESTIMATE = False
+
+def translateGPT(text, history, fullPromptFlag):
+    # Stands in for an engine's translateGPT, every call would be a paid request
+    SENT.append(text)
+    return [text, [10, 10]]
+
+@pytest.fixture
+def modules(loadModules):
+    SENT.clear()
+    return loadModules(['dedup', 'memory'])
+
+def test_collect_sends_nothing_without_memory(modules):
+    dedup, memory = modules
+    wrapper = memory.translationMemory(translateGPT)
+
+    def handler(filename, estimate):
+        wrapper(['テスト', 'もう一行'], [], True)
+        return ''
+
+    assert dedup.dedupProject(handler, ['Map001.json', 'Map002.json'], 1) == [0, 0]
+    assert SENT == []
+
+def test_collecting_wrapper_sends_nothing_without_memory(modules):
+    dedup, memory = modules
+    wrapper = memory.translationMemory(translateGPT)
+    dedup.COLLECTING = True
+    try:
+        assert wrapper('テスト', [], False) == ['テスト', [0, 0]]
+    finally:
+        dedup.COLLECTING = False
+    assert SENT == []
+
+def test_collect_leaves_no_trace(loadModules, tmp_path, capsys):
+    dedup, memory, mvmz = loadModules(['dedup', 'memory', 'rpgmakermvmz'], {'memory': 'memory.db'})
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'translated').mkdir()
+    commands = [{'code': 401, 'indent': 0, 'parameters': ['やっと来た。']}, {'code': 0, 'indent': 0, 'parameters': []}]
+    data = {'displayName': '', 'events': [None, {'id': 1, 'name': 'EV001', 'note': '', 'pages': [{'list': commands}]}]}
+    (tmp_path / 'files' / 'Map001.json').write_text(json.dumps(data), encoding='utf-8')
+
+    # One collect round by hand, nothing is translated
+    dedup.COLLECTING = True
+    try:
+        assert mvmz.handleMVMZ('Map001.json', False) == ''
+    finally:
+        dedup.COLLECTING = False
+    assert len(dedup.PENDING) > 0
+    assert list((tmp_path / 'translated').iterdir()) == []
+    assert mvmz.TOKENS == [0, 0]
+    assert 'Map001.json' not in capsys.readouterr().out
@@ -0,0 +1,20 @@
+# Libraries
+import pytest
+
+# Mismatch Recovery
+# A batch that came back short is sent again in halves, down to single lines, and only a line that never comes back
+# is left out.
+
+@pytest.fixture
+def recovery(loadModules):
+    return loadModules(['recovery'])[0]
+
+def test_recover_list_splits_short_batches(recovery):
+    def translate(lines):
+        # Loses a line in anything longer than two, never translates 'C'
+        translatedList = [line.lower() for line in lines if line != 'C']
+        return [translatedList[:-1] if len(lines) > 2 else translatedList, [1, 1]]
+
+    translatedList, tokens = recovery.recoverList(['A', 'B', 'C', 'D', 'E'], translate)
+    assert translatedList == ['a', 'b', None, 'd', 'e']
+    assert tokens == [4, 4]